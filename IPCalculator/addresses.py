@@ -0,0 +1,76 @@
+# turning IP addresses into integers, one at a time or a whole list at once with numpy
+import numpy as np
+
+MAX_LENGTH = 15 # the longest dotted quad, "255.255.255.255"
+LANE = 16 # bits given to each of the four numbers of an address by to_lanes
+
+# function to turn a dotted quad into a 32 bit integer
+def to_int(address):
+    a, b, c, d = address.split('.')
+    return (int(a) << 24) | (int(b) << 16) | (int(c) << 8) | int(d)
+
+# function to turn a dotted quad into an integer with each number in its own 16 bit lane instead of its own byte
+# adding to one number can then never carry into the next, so a number that goes past 255 is printed as it is, like the
+# subnet calculator has always done
+def to_lanes(address):
+    a, b, c, d = address.split('.')
+    return (int(a) << 48) | (int(b) << 32) | (int(c) << 16) | int(d)
+
+# function to turn a 32 bit integer back into a dotted quad
+def to_text(value):
+    return '{}.{}.{}.{}'.format(value >> 24, (value >> 16) & 255, (value >> 8) & 255, value & 255)
+
+# function to turn an integer from to_lanes back into a dotted quad
+def lanes_text(value):
+    return '{}.{}.{}.{}'.format(value >> 48, (value >> 32) & 0xFFFF, (value >> 16) & 0xFFFF, value & 0xFFFF)
+
+# function to split an integer from to_lanes into a template with a gap for the number at position, and the value of that number
+# template.format(number) then gives the address with that number changed, without working out the other three numbers again
+def stepped_template(value, position):
+    numbers = [str(value >> 48), str((value >> 32) & 0xFFFF), str((value >> 16) & 0xFFFF), str(value & 0xFFFF)]
+    start = (value >> (LANE * (3 - position))) & 0xFFFF
+    numbers[position] = '{}' # the number that changes
+    return '.'.join(numbers), start
+
+# function to turn a list of dotted quad strings into an array of 32 bit integers
+# returns the integers and an array saying which addresses were valid, invalid addresses are given the integer 0
+def parse_addresses(addresses):
+    count = len(addresses)
+    result = np.zeros(count, dtype=np.uint32)
+    if count == 0:
+        return result, np.zeros(0, dtype=bool)
+    chars = _characters(addresses) # one row of bytes per address, padded with zeros
+    dots = chars == ord('.')
+    digits = (chars - ord('0')) < 10 # the subtraction wraps around for anything below '0', so this checks both ends at once
+    lengths = (chars != 0).sum(axis=1)
+    valid = ((digits | dots | (chars == 0)).all(axis=1) # only digits and dots
+             & (dots.sum(axis=1) == 3) # exactly four numbers
+             & (chars[:, MAX_LENGTH] == 0)) # not too long
+
+    rows = np.flatnonzero(valid)
+    lengths = lengths[rows]
+    places = np.nonzero(dots[rows])[1].reshape(-1, 3).astype(np.int64) # the columns of the three dots in each address
+    values = chars.ravel() - np.uint8(ord('0')) # the digit at every position of every address, in one flat array
+    base = rows * (MAX_LENGTH + 1) # where each address starts in the flat array
+    ok = np.ones(len(rows), dtype=bool)
+    ints = np.zeros(len(rows), dtype=np.int64)
+    for i in range(4): # add up each number from its last three digits, every address at once
+        start = places[:, i - 1] + 1 if i else 0 # each number starts after a dot
+        end = places[:, i] if i < 3 else lengths # and ends at the next dot or the end of the address
+        size = end - start
+        ok &= (size >= 1) & (size <= 3) # one to three digits
+        number = values[base + end - 1].astype(np.int64)
+        number += np.where(size >= 2, values[base + np.maximum(end - 2, 0)], 0).astype(np.int64) * 10
+        number += np.where(size >= 3, values[base + np.maximum(end - 3, 0)], 0).astype(np.int64) * 100
+        ok &= number <= 255 # every number fits in a byte
+        ints = (ints << 8) | number
+    valid[rows] = ok
+    result[rows] = np.where(ok, ints, 0)
+    return result, valid
+
+def _characters(addresses): # a (number of addresses, MAX_LENGTH + 1) array of the bytes of each address
+    try:
+        chars = np.asarray(addresses, dtype='S{}'.format(MAX_LENGTH + 1))
+    except UnicodeEncodeError: # a string that isn't ascii can't be an address, but the rest of the list still can
+        chars = np.minimum(np.asarray(addresses, dtype='U{}'.format(MAX_LENGTH + 1)).view(np.uint32), 255).astype(np.uint8).view('S{}'.format(MAX_LENGTH + 1))
+    return chars.view(np.uint8).reshape(len(addresses), MAX_LENGTH + 1)
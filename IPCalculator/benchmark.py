@@ -0,0 +1,197 @@
+# benchmark for the subnet calculator, run with: python benchmark.py --requests 2000
+# it checks that the integer version gives exactly the same answers as the original string version, and times both
+# with --prefixes 1000000 it also times longest prefix match lookups on a table of that many random prefixes
+import argparse
+import random
+import time
+
+import numpy as np
+
+from addresses import to_text
+from main import subnet_info
+from prefixes import PrefixIndex
+
+# the original string based versions of the subnet functions, kept here to compare against
+#function to find the ip address in CIDR notation
+def legacy_cidr(ip, mask):
+    split_mask = mask.split(".") # split the subnet mask into a list of the numbers
+    
+    binary_mask = '' # create a string that will hold the binary version of the subnet mask
+    for elem in split_mask: # go through each number in the mask
+        bin_elem = bin(int(elem))[2:].zfill(8) # convert the number into binary and zfill(8) ensures the binary number will be 8 bits
+        binary_mask += str(bin_elem) # add the binary number to the binary mask
+
+    host_bits = 0
+    while binary_mask[host_bits] != '0': # loop through the binary mask to count how many ones are at the start -> host bits
+        host_bits += 1
+    #binary_mask.count('1')
+
+    return ip + '/' + str(host_bits), host_bits # return the ip address with the CIDR notation and the number of host bits
+
+# function to return the number of subnets there will be
+def legacy_num_subnets(host_bits):
+    bits = host_bits % 8 # find the leftover bits that arent in a byte of 8 ones
+    return 2 ** bits
+
+# function to return the number of hosts each subnet will have
+def legacy_num_hosts(host_bits):
+    bits = 32 - host_bits # number of zero bits in the subnet mask
+    return (2 ** bits) - 2 # minus two since the first (network) and last (broadcast) address are not addressable hosts
+
+# function that will return a list of the valid subnets
+def legacy_valid_subnets(ip, mask, host_bits): # function takes the ip address, subnet mask, and number of host bits
+    split_mask = mask.split('.') # split the subnet mask on the '.'
+    position = 0
+    subnet_mask = 0
+    while position < 4: # loop through the split subnet mask
+        if split_mask[position] != '255': # find the first element that isnt '255'
+            subnet_mask = int(split_mask[position]) # set the subnet_mask to that element
+            break # found the element so break out of the loop
+        position += 1
+    block = 256 - subnet_mask # find the block size of each subnet
+
+    split_ip = ip.split('.') # split the ip address on the '.'
+    subnets = [] # create a list to hold the subnets 
+    
+    i = 0
+    while i < legacy_num_subnets(host_bits): # find how many subnets there will be and loop through the number
+        subnets.append('.'.join(split_ip)) # add the ip address to the list of subnets
+        split_ip[position] = str(int(split_ip[position]) + block) # increase the ip address by the block size
+        i += 1
+
+    return subnets, block, position # return the list of subnets, the block size, and the position of the subnet mask
+
+# function that finds the first address of each subnet
+def legacy_first_addresses(subnets): # function takes the list of subnets and the position of the subnet mask
+    first_addresses = [] # create a new list
+    for subnet in subnets:
+        split_subnet = subnet.split('.') # split the subnet
+        split_subnet[3] = str(int(split_subnet[3]) + 1) # increase the last number by one
+        first_addresses.append('.'.join(split_subnet)) # rejoin the subnet and add it to the list of first addresses
+
+    return first_addresses
+
+# function that returns the broadcast addresses
+def legacy_broadcast_addresses(subnets, position, block_size):
+    broadcast_addresses = []
+    for subnet in subnets:
+        split_subnet = subnet.split('.')
+        split_subnet[position] = str(int(split_subnet[position]) + block_size - 1) # increase the subnet by the block size
+        if position != 3: # if the position of the subnet mask isnt the last number
+            new_position = position + 1
+            while new_position <= 3: # loop through the remaining numbers
+                split_subnet[new_position] = '255' # change each following number to '255'
+                new_position += 1
+        broadcast_addresses.append('.'.join(split_subnet)) # add the updated address to the list of broadcast addresses
+
+    return broadcast_addresses
+
+# function to return the list of last addresses of each subnet
+def legacy_last_addresses(subnets, position, block_size):
+    last_addresses = []
+    for subnet in subnets:
+        split_subnet = subnet.split('.')
+        if position == 3: # if the subnet mask is the last number
+            split_subnet[position] = str(int(split_subnet[position]) + block_size - 2) # increase by the block minus 2, 
+                                                                                       # since the last address is the broadcast address
+        else:
+            split_subnet[position] = str(int(split_subnet[position]) + block_size - 1) # increase by the block minus 1
+            new_position = position + 1
+            while new_position < 3: # loop through the numbers until you reach the last one
+                split_subnet[new_position] = '255' # update them to be 255
+                new_position += 1
+
+            split_subnet[new_position] = '254' # finally change the last number to 254, since 255 is the broadcast address
+        last_addresses.append('.'.join(split_subnet)) # rejoin the subnet and add it to the list
+
+    return last_addresses
+
+def legacy_subnet_info(ip, mask): # the original /subnet endpoint
+    cidr_notation, host_bits = legacy_cidr(ip, mask)
+    subnets, block_size, position = legacy_valid_subnets(ip, mask, host_bits)
+    return {
+	"address_cidr" : '{}'.format(cidr_notation),
+    "num_subnets": legacy_num_subnets(host_bits),
+    "addressable_hosts_per_subnet": legacy_num_hosts(host_bits),
+    "valid_subnets": subnets,
+    "broadcast_addresses": legacy_broadcast_addresses(subnets, position, block_size),
+    "first_addresses": legacy_first_addresses(subnets),
+    "last_addresses": legacy_last_addresses(subnets, position, block_size)
+    }
+
+# subnet mask with a given number of ones at the start, as a dotted quad
+def mask_text(bits):
+    mask = (0xFFFFFFFF << (32 - bits)) & 0xFFFFFFFF
+    return '.'.join(str((mask >> shift) & 255) for shift in (24, 16, 8, 0))
+
+# random (ip address, mask) requests, for masks with the given numbers of ones
+# aligned requests use the first address of a block like the examples, the others can be any address
+def random_requests(count, bits, seed, aligned):
+    rand = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        size = rand.choice(bits)
+        ip = rand.getrandbits(32)
+        if aligned:
+            ip &= (0xFFFFFFFF << (32 - 8 * (size // 8))) & 0xFFFFFFFF # keep the whole bytes of the mask, the subnets split the rest
+        requests.append(('.'.join(str((ip >> shift) & 255) for shift in (24, 16, 8, 0)), mask_text(size)))
+    return requests
+
+# time a function over a list of (ip, mask) requests and return the average time per request in microseconds, best of a few runs
+def time_requests(function, requests, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for ip, mask in requests:
+            function(ip, mask)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000000 / len(requests)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the subnet calculator against the original string version.')
+    parser.add_argument('--requests', type=int, default=2000, help='number of random requests for each mask size')
+    parser.add_argument('--prefixes', type=int, default=0, help='also time prefix lookups on a table of this many random prefixes')
+    parser.add_argument('--lookups', type=int, default=100000, help='number of random addresses to look up in the prefix table')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for aligned in (True, False): # every answer has to match the original, including for addresses that aren't the start of a block
+        for bits in range(1, 32):
+            for ip, mask in random_requests(200, [bits], args.seed, aligned):
+                if subnet_info(ip, mask) != legacy_subnet_info(ip, mask):
+                    raise SystemExit('different answer for {} {}'.format(ip, mask))
+    print('answers match the original for every mask size')
+
+    print('{:>6}  {:>8}  {:>14}  {:>14}  {:>8}'.format('mask', 'subnets', 'original us', 'integer us', 'speedup'))
+    for bits in (8, 16, 18, 20, 22, 24, 26, 28, 30, 31):
+        requests = random_requests(args.requests, [bits], args.seed, True)
+        legacy_us = time_requests(legacy_subnet_info, requests)
+        new_us = time_requests(subnet_info, requests)
+        print('{:>6}  {:>8}  {:>14.2f}  {:>14.2f}  {:>7.1f}x'.format('/' + str(bits), 2 ** (bits % 8), legacy_us, new_us, legacy_us / new_us))
+    if args.prefixes:
+        time_prefixes(args.prefixes, args.lookups, args.seed)
+
+# random prefixes with lengths spread roughly like a full internet routing table, where most prefixes are /24
+def random_prefixes(count, seed):
+    rand = random.Random(seed)
+    lengths = [24] * 12 + [22, 22, 23, 23, 20, 21, 19, 16, 18, 17, 8, 12, 28, 32]
+    return ['{}/{}'.format(to_text(rand.getrandbits(32)), rand.choice(lengths)) for _ in range(count)]
+
+def time_prefixes(count, lookups, seed):
+    table = random_prefixes(count, seed)
+    start = time.perf_counter()
+    index = PrefixIndex(table)
+    print('prefix table: {} prefixes in {} ranges, loaded in {:.2f} s'.format(len(index), index.ranges(), time.perf_counter() - start))
+    rand = random.Random(seed)
+    addresses = [rand.getrandbits(32) for _ in range(lookups)]
+    start = time.perf_counter()
+    for address in addresses:
+        index.lookup(address)
+    print('{:>20}: {:8.2f} us/lookup'.format('one at a time', (time.perf_counter() - start) * 1e6 / lookups))
+    array = np.array(addresses, dtype=np.uint32)
+    start = time.perf_counter()
+    index.lookup_many(array)
+    print('{:>20}: {:8.2f} us/lookup'.format('batch', (time.perf_counter() - start) * 1e6 / lookups))
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,14 @@
+import json
+from collections import OrderedDict
+from itertools import islice
+
+import numpy as np
 from pydantic import BaseModel
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from addresses import LANE, lanes_text, parse_addresses, stepped_template, to_int, to_lanes, to_text
+from prefixes import PrefixIndex
 
 description = """
 The first networks assignment is an IP address calculator that can return information on an IP address, subnet an IP address, and supernet 
@@ -40,6 +49,26 @@ This is an example of a class B address. A class C address such as `"210.130.0.0
   "last_address": "223.255.255.255"
 }`
 
+## Batch IP Calculator
+
+The batch IP calculator runs the IP calculator on a whole **list of ip addresses** at once, for example every address in a log file. 
+Instead of one answer per address it returns one list for each field of the IP calculator, with one entry per address in the order 
+they were given:
+
+`{
+  "class": ["B", "C"],
+  "num_networks": [16384, 2097152],
+  "num_hosts": [65536, 256],
+  "first_address": ["128.0.0.0", "192.0.0.0"],
+  "last_address": ["191.255.255.255", "223.255.255.255"]
+}`
+
+for the list `["172.16.52.63", "210.130.0.0"]`. Every address must be a full dotted quad, and the entries for any address that isn't 
+one are `null`.
+
+`/ipcalc/batch` takes the list as JSON, `{"addresses": ["172.16.52.63", "210.130.0.0"]}`, and `/ipcalc/lines` takes a plain text 
+body with one address per line, which is worked on as it is uploaded so very large files can be sent.
+
 ## Subnet Calculator
 
 Subnetting is used to make it easier to manage and maintain a large block of IP addresses by breaking them down into smaller blocks of IP 
@@ -88,6 +117,22 @@ For example if you entered the IP address `"172.16.0.0"` and the subnet mask `"2
   ]
 }`
 
+The request can also ask for:
+* `"new_prefix"`, to split the network into subnets with that many network bits instead, for example `"new_prefix": 28` with the mask 
+`"255.255.0.0"` splits the network into 4096 subnets of 16 addresses.
+* `"offset"` and `"limit"`, to only return the subnets from `offset` onwards, and at most `limit` of them. The response then also has a 
+`"next_offset"`, which is the offset of the next page, or `null` after the last page. Only the subnets on the page are worked out, so 
+any page of a very large split is as quick to get as the first one. With `"new_prefix"` the subnets always come a page at a time: 
+`"limit"` is 1024 if it isn't given and can be at most 16384, so one request can't ask for millions of subnets at once 
+(use `/subnet/stream` for that).
+
+Answers to `/subnet` are kept in a cache of the most recently asked questions, so asking the same question again is answered 
+straight away. `GET /subnet/cache` returns how many answers are kept, the most it will keep, and the hits, misses and hit rate of the cache.
+
+`/subnet/stream` takes the same request and returns newline delimited JSON instead: a first line with the address in CIDR notation, the 
+number of subnets and the hosts per subnet, then one line per subnet with its `"subnet"`, `"broadcast_address"`, `"first_address"` and 
+`"last_address"`. The subnets are made as they are sent, so millions of subnets can be read without the server holding them all.
+
 ## Supernet Calculator
 
 Supernetting is used if someone wants to request a block of IP addresses that is larger than the block size of one class but smaller 
@@ -108,12 +153,57 @@ was the list of IP addresses given it would return:
   "address": "192.0.0.0/22",
   "mask": "255.255.252.0"
 }`
+
+The addresses are compared as whole numbers all at once, so lists of hundreds of thousands of addresses can be given. An empty list, or 
+a list with something in it that isn't an IP address, returns a 400 error.
+
+If `"summarize": true` is also given, the calculator instead returns the smallest list of blocks that covers exactly the same addresses 
+as the networks given, without the extra addresses a single supernet would also take in. Each entry of the list can be a network in CIDR 
+notation like `"10.1.0.0/16"`, or just an address, which means the whole network of its class (/8 for class A, /16 for class B, /24 for 
+class C, and only the address itself for class D and E). Networks that overlap or are next to each other are joined, so 
+`["192.0.0.0", "192.0.1.0", "192.0.2.0", "192.0.4.0/23"]` would return:
+
+`{
+  "blocks": [
+    {"address": "192.0.0.0/23", "mask": "255.255.254.0"},
+    {"address": "192.0.2.0/24", "mask": "255.255.255.0"},
+    {"address": "192.0.4.0/23", "mask": "255.255.254.0"}
+  ]
+}`
+
+## Prefix Lookup
+
+The Prefix Lookup finds which of a table of prefixes an IP address falls in. If the address is in more than one prefix, like 
+`10.0.0.0/8` and `10.1.0.0/16`, the longest one is returned (longest prefix match), which is how a router picks the route for an address.
+
+`/prefixes` loads the table from a **list of prefixes** in CIDR notation, the same notation the Subnet Calculator returns. Any bits of 
+an address past the prefix length are ignored, so `"10.1.2.3/16"` is loaded as `10.1.0.0/16`. Loading a table replaces the one before it 
+and returns the number of prefixes and the number of ranges they were flattened into. 
+`["10.0.0.0/8", "10.1.0.0/16", "192.168.0.0/24"]` would return:
+
+`{
+  "prefixes": 3,
+  "ranges": 7
+}`
+
+The prefixes are flattened into ranges of addresses that don't overlap when they are loaded, so each lookup is a single binary search 
+that takes microseconds, even with a full routing table of a million prefixes loaded.
+
+`/prefixes/lookup` takes **an IP address** and returns the address and the prefix it falls in, or `null` if no prefix covers it:
+
+`{
+  "address": "10.1.2.3",
+  "prefix": "10.1.0.0/16"
+}`
+
+`/prefixes/lookup/batch` takes a **list of ip addresses** and returns `"prefixes"`, a list with the prefix of each address in the same 
+order, `null` for an address no prefix covers or that isn't an IP address.
 """
 
 tags_metadata = [
     {
         "name": "ipcalc",
-        "description": "Enter an IP address in double quotes.",
+        "description": "Enter an IP address in double quotes, or a list of IP addresses.",
     },
     {
         "name": "subnet",
@@ -123,6 +213,10 @@ tags_metadata = [
         "name": "supernet",
         "description": "Enter a list of IP addresses.",
     },
+    {
+        "name": "prefixes",
+        "description": "Load a table of prefixes, then look up which prefix IP addresses fall in.",
+    },
 ]
 
 app = FastAPI(
@@ -135,14 +229,30 @@ app = FastAPI(
 class IPcalcItem(BaseModel):
     address: str # for the IP calculator it only takes one argument: an ip address enclosed in a string
 
+# post request body for the batch IP calculator
+class BatchIPcalcItem(BaseModel):
+    addresses: list # a list of ip addresses enclosed in strings
+
 # post request body for the subnet mask calculator
 class SubnetItem(BaseModel):
     address: str
     mask: str
+    new_prefix: int = None # optionally split the network into subnets with this many network bits
+    offset: int = 0 # the first subnet to return, for walking through a large list of subnets a page at a time
+    limit: int = None # the most subnets to return, all of them if it isn't given
 
 # post request body for the supernet calculator
 class SupernetItem(BaseModel):
     addresses: list
+    summarize: bool = False # return the smallest list of CIDR blocks covering the networks instead of one supernet
+
+# post request body for loading the prefix table
+class PrefixTableItem(BaseModel):
+    prefixes: list # prefixes in CIDR notation enclosed in strings
+
+# post request body for looking up one address in the prefix table
+class PrefixLookupItem(BaseModel):
+    address: str
 
 # hardcoding the host and network bits for each class with a dictionary
 # given in assignment description
@@ -216,38 +326,89 @@ def ip_range(letter): # takes the class
     elif letter == 'E':
         return '240.0.0.0', '255.255.255.255'
 
+# the answer of the ip calculator for each class, and the class of each first number, worked out once when the server starts
+CLASS_ANSWERS = {
+    letter: { # the class, number of networks, number of hosts, first address and last address of the class
+    "class": letter,
+    "num_networks": networks(letter),
+    "num_hosts": hosts(letter),
+    "first_address": ip_range(letter)[0],
+    "last_address": ip_range(letter)[1],
+    } for letter in classes
+}
+FIRST_NUMBER_CLASSES = {number: which_class(str(number)) for number in range(256)}
+
 @app.post("/ipcalc", tags=['ipcalc'])
 async def ipcalc(item : IPcalcItem):
-    ipclass = which_class(item.address) # find which class the ip address is
-    min, max = ip_range(ipclass) # find the range of the ip addresses for the class
-    # return the ipcalc information in JSON format
-    return { # return the class, number of networks, number of hosts, first address and last address of the ip address
-	"class": '{}'.format(ipclass),
-    "num_networks": networks(ipclass),
-    "num_hosts": hosts(ipclass),
-    "first_address": '{}'.format(min),
-    "last_address": '{}'.format(max),
-    }
+    ipclass = FIRST_NUMBER_CLASSES.get(int(item.address.split(".")[0])) # find which class the ip address is from its first number
+    return CLASS_ANSWERS[ipclass] # return the ipcalc information in JSON format
+
+# the answers of the ip calculator for each class, in the order of the class boundaries below, so a batch can look them up by position
+# the last entry is for addresses that aren't valid
+BATCH_CLASSES = ['A', 'B', 'C', 'D', 'E']
+BATCH_BOUNDARIES = np.array([128, 192, 224, 240]) # the first number of the first address of classes B to E
+BATCH_COLUMNS = {
+    name: np.array([CLASS_ANSWERS[letter][name] for letter in BATCH_CLASSES] + [None], dtype=object) for name in CLASS_ANSWERS['A']
+}
+
+# function to run the ip calculator on many addresses at once, returns a dictionary of numpy columns with one entry per address
+# addresses can be a list or any iterable (like an open file), which is read chunk_size addresses at a time
+def ipcalc_batch(addresses, chunk_size=65536):
+    if isinstance(addresses, (list, tuple, np.ndarray)):
+        return _ipcalc_columns(addresses)
+    addresses = iter(addresses)
+    chunks = []
+    while True:
+        chunk = [address.strip() for address in islice(addresses, chunk_size)] # lines from a file still have their new line
+        if not chunk:
+            break
+        chunks.append(_ipcalc_columns(chunk))
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) if chunks else column[:0] for name, column in BATCH_COLUMNS.items()}
+
+def _ipcalc_columns(addresses):
+    ints, valid = parse_addresses(addresses) # every address at once, as 32 bit integers
+    index = np.searchsorted(BATCH_BOUNDARIES, ints >> 24, side='right') # which class the first number falls in
+    index[~valid] = len(BATCH_CLASSES) # invalid addresses get None in every column
+    return {name: column[index] for name, column in BATCH_COLUMNS.items()}
+
+@app.post("/ipcalc/batch", tags=['ipcalc'])
+async def ipcalcbatch(item : BatchIPcalcItem):
+    columns = ipcalc_batch(item.addresses)
+    return {name: column.tolist() for name, column in columns.items()} # one list for each field of /ipcalc, in the order of the addresses
+
+@app.post("/ipcalc/lines", tags=['ipcalc'])
+async def ipcalclines(request : Request):
+    chunks = [] # the columns of each chunk of addresses, worked out as the body arrives
+    rest = b'' # any part of a line left over from the last chunk
+    async for data in request.stream():
+        lines = (rest + data).split(b'\n')
+        rest = lines.pop() # the last piece may be the start of a line in the next chunk
+        lines = [line.strip().decode('ascii', 'replace') for line in lines]
+        if lines:
+            chunks.append(_ipcalc_columns(lines))
+    if rest.strip():
+        chunks.append(_ipcalc_columns([rest.strip().decode('ascii', 'replace')]))
+    return {name: [value for chunk in chunks for value in chunk[name].tolist()] for name in BATCH_COLUMNS}
     
 
 #------------------------------------------------------------------------------
 
+# the mask of each of the 33 prefix lengths, and the prefix length of each mask, worked out once when the server starts
+MASK_INTS = [(0xFFFFFFFF << (32 - count)) & 0xFFFFFFFF for count in range(33)]
+MASK_TEXTS = [to_text(mask) for mask in MASK_INTS]
+MASK_LENGTHS = {text: count for count, text in enumerate(MASK_TEXTS)}
+
 #function to find the ip address in CIDR notation
 def cidr(ip, mask):
-    split_mask = mask.split(".") # split the subnet mask into a list of the numbers
-    
-    binary_mask = '' # create a string that will hold the binary version of the subnet mask
-    for elem in split_mask: # go through each number in the mask
-        bin_elem = bin(int(elem))[2:].zfill(8) # convert the number into binary and zfill(8) ensures the binary number will be 8 bits
-        binary_mask += str(bin_elem) # add the binary number to the binary mask
-
-    host_bits = 0
-    while binary_mask[host_bits] != '0': # loop through the binary mask to count how many ones are at the start -> host bits
-        host_bits += 1
-    #binary_mask.count('1')
-
+    host_bits = MASK_LENGTHS.get(mask)
+    if host_bits is None: # a mask written another way, like "255.255.255.000", or with ones after a zero
+        host_bits = leading_ones(to_int(mask)) # count how many ones are at the start of the mask -> host bits
     return ip + '/' + str(host_bits), host_bits # return the ip address with the CIDR notation and the number of host bits
 
+# function to count the ones at the start of a 32 bit mask
+def leading_ones(mask):
+    return 32 - (~mask & 0xFFFFFFFF).bit_length() # flipping the mask turns the leading ones into leading zeros
+
 # function to return the number of subnets there will be
 def num_subnets(host_bits):
     bits = host_bits % 8 # find the leftover bits that arent in a byte of 8 ones
@@ -258,153 +419,256 @@ def num_hosts(host_bits):
     bits = 32 - host_bits # number of zero bits in the subnet mask
     return (2 ** bits) - 2 # minus two since the first (network) and last (broadcast) address are not addressable hosts
 
-# function that will return a list of the valid subnets
-def valid_subnets(ip, mask, host_bits): # function takes the ip address, subnet mask, and number of host bits
-    split_mask = mask.split('.') # split the subnet mask on the '.'
-    position = 0
-    subnet_mask = 0
-    while position < 4: # loop through the split subnet mask
-        if split_mask[position] != '255': # find the first element that isnt '255'
-            subnet_mask = int(split_mask[position]) # set the subnet_mask to that element
-            break # found the element so break out of the loop
-        position += 1
-    block = 256 - subnet_mask # find the block size of each subnet
-
-    split_ip = ip.split('.') # split the ip address on the '.'
-    subnets = [] # create a list to hold the subnets 
-    
-    i = 0
-    while i < num_subnets(host_bits): # find how many subnets there will be and loop through the number
-        subnets.append('.'.join(split_ip)) # add the ip address to the list of subnets
-        split_ip[position] = str(int(split_ip[position]) + block) # increase the ip address by the block size
-        i += 1
-
-    return subnets, block, position # return the list of subnets, the block size, and the position of the subnet mask
-
-# function that finds the first address of each subnet
-def first_addresses(subnets): # function takes the list of subnets and the position of the subnet mask
-    first_addresses = [] # create a new list
-    for subnet in subnets:
-        split_subnet = subnet.split('.') # split the subnet
-        split_subnet[3] = str(int(split_subnet[3]) + 1) # increase the last number by one
-        first_addresses.append('.'.join(split_subnet)) # rejoin the subnet and add it to the list of first addresses
-
-    return first_addresses
-
-# function that returns the broadcast addresses
-def broadcast_addresses(subnets, position, block_size):
-    broadcast_addresses = []
-    for subnet in subnets:
-        split_subnet = subnet.split('.')
-        split_subnet[position] = str(int(split_subnet[position]) + block_size - 1) # increase the subnet by the block size
-        if position != 3: # if the position of the subnet mask isnt the last number
-            new_position = position + 1
-            while new_position <= 3: # loop through the remaining numbers
-                split_subnet[new_position] = '255' # change each following number to '255'
-                new_position += 1
-        broadcast_addresses.append('.'.join(split_subnet)) # add the updated address to the list of broadcast addresses
-
-    return broadcast_addresses
-
-# function to return the list of last addresses of each subnet
-def last_addresses(subnets, position, block_size):
-    last_addresses = []
-    for subnet in subnets:
-        split_subnet = subnet.split('.')
-        if position == 3: # if the subnet mask is the last number
-            split_subnet[position] = str(int(split_subnet[position]) + block_size - 2) # increase by the block minus 2, 
-                                                                                       # since the last address is the broadcast address
-        else:
-            split_subnet[position] = str(int(split_subnet[position]) + block_size - 1) # increase by the block minus 1
-            new_position = position + 1
-            while new_position < 3: # loop through the numbers until you reach the last one
-                split_subnet[new_position] = '255' # update them to be 255
-                new_position += 1
-
-            split_subnet[new_position] = '254' # finally change the last number to 254, since 255 is the broadcast address
-        last_addresses.append('.'.join(split_subnet)) # rejoin the subnet and add it to the list
-
-    return last_addresses
+# the number of subnets and hosts for each of the 33 prefix lengths, so requests look them up instead of working them out
+SUBNET_COUNTS = [num_subnets(host_bits) for host_bits in range(33)]
+HOST_COUNTS = [num_hosts(host_bits) for host_bits in range(33)]
+
+# function to work out the first subnet, every other subnet is the one before it plus the block size
+# returns the position of the first number of the mask that isn't 255, the block size, and the (subnet, broadcast address, first address,
+# last address) of the first subnet as integers from to_lanes
+def first_subnet(ip, mask, host_bits): # function takes the ip address and subnet mask as integers, and the number of host bits
+    position = host_bits // 8 # the first number of the mask that isn't 255
+    block = 256 - ((mask >> (8 * (3 - position))) & 255) # find the block size of each subnet
+    shift = LANE * (3 - position) # where that number is in the address
+    below = (1 << shift) - 1 # every lane after the position
+    broadcast = ((ip + ((block - 1) << shift)) & ~below) | (below // 0xFFFF * 255) # increase by the block minus 1, and every following number is 255
+    return position, block, (ip, broadcast, ip + 1, broadcast - 1) # the first and last addresses are the ones either side of the subnet and broadcast
+
+# function to describe the subnets without making any of them yet
+# returns the address in CIDR notation, the number of subnets, the number of hosts per subnet, the step between one subnet and the next,
+# and a (text, start) pair for each of the subnet, broadcast, first and last addresses. the address for subnet i is
+# text(start + i * step), so any subnet can be made straight away without going through the ones before it
+def subnet_plan(ip, mask, new_prefix=None):
+    cidr_notation, host_bits = cidr(ip, mask)
+    if new_prefix is None: # subnets of the first number of the mask that isn't 255, like the calculator has always done
+        position, block, first = first_subnet(to_lanes(ip), to_int(mask), host_bits)
+        fields = [stepped_template(value, position) for value in first]
+        fields = [(template.format, start) for template, start in fields]
+        return cidr_notation, SUBNET_COUNTS[host_bits], HOST_COUNTS[host_bits], block, fields
+    if not host_bits <= new_prefix <= 32:
+        raise HTTPException(status_code=400, detail="new_prefix must be between {} and 32".format(host_bits))
+    network = to_int(ip) & MASK_INTS[host_bits] # the first address of the network
+    block = 1 << (32 - new_prefix) # the number of addresses in each subnet
+    fields = [(to_text, network), (to_text, network + block - 1), (to_text, network + 1), (to_text, network + block - 2)]
+    return cidr_notation, 2 ** (new_prefix - host_bits), HOST_COUNTS[new_prefix], block, fields
+
+SMALL_SPLIT = 4 # subnet_info makes splits into this many subnets or fewer without a plan
+
+# function to return where a page of subnets stops
+def page_stop(count, offset, limit):
+    if offset < 0 or (limit is not None and limit < 0):
+        raise HTTPException(status_code=400, detail="offset and limit can't be negative")
+    return count if limit is None else min(count, offset + limit)
+
+# function that yields the (subnet, broadcast address, first address, last address) of each subnet from offset onwards, one at a time
+def subnet_rows(plan, offset=0, limit=None):
+    _, count, _, step, fields = plan
+    for i in range(offset, page_stop(count, offset, limit)):
+        yield [text(start + i * step) for text, start in fields]
+
+# function to return everything the subnet calculator returns for an ip address and subnet mask
+# with an offset or a limit only that page of the subnets is made, and next_offset says where the next page starts (None after the last page)
+# a split into a few subnets, which is most requests, makes each address straight from the integers, since making the templates
+# of subnet_plan takes longer than the few addresses it saves work on
+def subnet_info(ip, mask, new_prefix=None, offset=0, limit=None):
+    cidr_notation, host_bits = cidr(ip, mask)
+    if new_prefix is None and SUBNET_COUNTS[host_bits] <= SMALL_SPLIT:
+        count, hosts = SUBNET_COUNTS[host_bits], HOST_COUNTS[host_bits]
+        stop = page_stop(count, offset, limit)
+        mask_int = MASK_INTS[host_bits] if MASK_LENGTHS.get(mask) == host_bits else to_int(mask) # most masks are written the usual way
+        position, block, (network, broadcast, first, last) = first_subnet(to_lanes(ip), mask_int, host_bits)
+        step = block << (LANE * (3 - position)) # the block size, in the lane of the number that changes
+        rows = range(offset, stop)
+        subnets = [lanes_text(network + i * step) if i else ip for i in rows] # the first subnet is the address itself
+        broadcasts, firsts, lasts = [[lanes_text(value + i * step) for i in rows] for value in (broadcast, first, last)]
+    else:
+        cidr_notation, count, hosts, step, fields = subnet_plan(ip, mask, new_prefix) # work with integers and only turn them into text at the end
+        stop = page_stop(count, offset, limit)
+        subnets, broadcasts, firsts, lasts = [list(map(text, range(start + offset * step, start + stop * step, step))) for text, start in fields]
+    info = {
+	"address_cidr" : '{}'.format(cidr_notation),
+    "num_subnets": count,
+    "addressable_hosts_per_subnet": hosts,
+    "valid_subnets": subnets,
+    "broadcast_addresses": broadcasts,
+    "first_addresses": firsts,
+    "last_addresses": lasts
+    }
+    if offset or limit is not None: # only paged requests get the extra field, so the response is the same as always otherwise
+        info["next_offset"] = stop if stop < count else None
+    return info
+
+SUBNET_CACHE_SIZE = 4096 # how many answers of the subnet calculator to keep, 0 turns the cache off
+SUBNET_CACHE_ROWS = 1024 # answers with more subnets than this aren't kept, so a few huge answers can't fill the memory
+subnet_cache = OrderedDict() # answers by (address, mask as an integer, new_prefix, offset, limit), least recently used first
+subnet_cache_stats = {"hits": 0, "misses": 0}
+
+# function to return subnet_info from the cache when the same question has been asked before
+# only the async /subnet endpoint uses the cache, and that always runs on the one event loop thread, so it doesn't need a lock
+def cached_subnet_info(ip, mask, new_prefix=None, offset=0, limit=None):
+    key = (ip, to_int(mask), new_prefix, offset, limit) # the mask as an integer, so "255.255.255.000" is the same question as "255.255.255.0"
+    info = subnet_cache.get(key)
+    if info is not None:
+        subnet_cache.move_to_end(key) # now the most recently used
+        subnet_cache_stats["hits"] += 1
+        return info
+    subnet_cache_stats["misses"] += 1
+    info = subnet_info(ip, mask, new_prefix, offset, limit)
+    if SUBNET_CACHE_SIZE > 0 and len(info["valid_subnets"]) <= SUBNET_CACHE_ROWS:
+        subnet_cache[key] = info
+        while len(subnet_cache) > SUBNET_CACHE_SIZE: # drop the least recently used answers once the cache is full
+            subnet_cache.popitem(last=False)
+    return info
+
+SUBNET_DEFAULT_LIMIT = 1024 # subnets returned by /subnet with a new_prefix when no limit is given
+SUBNET_MAX_LIMIT = 16384 # the most subnets /subnet returns at once with a new_prefix, a /8 split into /32s would be 16 million
 
 @app.post("/subnet", tags=['subnet'])
 async def subnet(item : SubnetItem):
-    ip, mask = item.address, item.mask
-    cidr_notation, host_bits = cidr(ip, mask)
-    subnets, block_size, position = valid_subnets(ip, mask, host_bits)
+    limit = item.limit
+    if item.new_prefix is not None: # splits can have millions of subnets, so they are always paged
+        limit = SUBNET_DEFAULT_LIMIT if limit is None else min(limit, SUBNET_MAX_LIMIT)
+    return cached_subnet_info(item.address, item.mask, item.new_prefix, item.offset, limit)
+
+@app.get("/subnet/cache", tags=['subnet'])
+async def subnetcache():
+    hits, misses = subnet_cache_stats["hits"], subnet_cache_stats["misses"]
     return {
-	"address_cidr" : '{}'.format(cidr_notation),
-    "num_subnets": num_subnets(host_bits),
-    "addressable_hosts_per_subnet": num_hosts(host_bits),
-    "valid_subnets": subnets,
-    "broadcast_addresses": broadcast_addresses(subnets, position, block_size),
-    "first_addresses": first_addresses(subnets),
-    "last_addresses": last_addresses(subnets, position, block_size)
+    "size": len(subnet_cache),
+    "max_size": SUBNET_CACHE_SIZE,
+    "hits": hits,
+    "misses": misses,
+    "hit_rate": hits / (hits + misses) if hits + misses else 0.0
     }
 
+@app.post("/subnet/stream", tags=['subnet'])
+async def subnetstream(item : SubnetItem):
+    plan = subnet_plan(item.address, item.mask, item.new_prefix)
+    page_stop(plan[1], item.offset, item.limit) # check the offset and limit now, once the response has started an error can't be sent
+
+    def lines(): # one line of JSON for the whole network, then one line per subnet, made as they are sent
+        cidr_notation, count, hosts, _, _ = plan
+        yield json.dumps({"address_cidr": cidr_notation, "num_subnets": count, "addressable_hosts_per_subnet": hosts}) + '\n'
+        rows = subnet_rows(plan, item.offset, item.limit)
+        while True: # send the subnets a chunk at a time, sending each line on its own is much slower
+            chunk = [json.dumps({"subnet": subnet, "broadcast_address": broadcast, "first_address": first, "last_address": last}) + '\n'
+                     for subnet, broadcast, first, last in islice(rows, 1024)]
+            if not chunk:
+                return
+            yield ''.join(chunk)
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
 #--------------------------------------------------------------------------------------
 
-# function that will return the smallest ip address from a list of ip addresses
-def min_address(addresses):
-    int_addresses = [] # create a list to store the addresses as integers
-    for address in addresses: # loop through the addresses
-        tmp_address = ''
-        for num in address:
-            if num != '.':
-                tmp_address += num # add the numbers to the address without the '.'
-        int_addresses.append(int(tmp_address)) # add the address as an integer to the list
+# function to turn the list of addresses into an array of 32 bit integers, every address at once
+def address_ints(addresses):
+    ints, valid = parse_addresses(addresses)
+    if len(ints) == 0:
+        raise HTTPException(status_code=400, detail="Enter at least one IP address")
+    if not valid.all(): # tell the user which addresses are wrong instead of failing part of the way through
+        bad = [addresses[i] for i in np.flatnonzero(~valid)[:10]]
+        raise HTTPException(status_code=400, detail="Not IP addresses: {}".format(bad))
+    return ints
 
-    return int_addresses.index(min(int_addresses)) # return the index of the smallest address
+# function that will return the position of the smallest ip address from an array of addresses as integers
+def min_address(ints):
+    return int(ints.argmin()) # compare the addresses as whole numbers, the first one is returned if there is a tie
 
 # function to return the supernet in CIDR notation
 def supernet_cidr(addresses):
-    bin_addresses = [] # create a list to store the addresses in binary
-    for address in addresses:
-        split_address = address.split(".")
-        
-        bin_address = ''
-        for elem in split_address: # go through each element in the split address
-            bin_address += str(bin(int(elem))[2:].zfill(8)) # convert the number into binary and convert back to a string and add to address
-        bin_addresses.append(bin_address) # add the address in binary to the list
-
-    i = 0
-    count = 0
-    while i < 32: # loop through the length of the binary address
-        same = True # set same to True
-        matching_bit = bin_addresses[0][i] # take the first address and compare its bits with the the other addresses
-        for elem in bin_addresses:
-            if elem[i] != matching_bit: # if one of the addresses bits doesnt match the first address' bit
-                same = False # set same to be False and break the loop
-                break
-        
-        if same == True: # if same stays true, the bit in all the addresses match
-            count += 1 # increase the count
-        else:
-            break # if same has changed, stop counting and break the loop
-        i += 1
-
-    supernet = str(addresses[min_address(addresses)]) + '/' + str(count) # combine the smallest address with the count
+    ints = address_ints(addresses)
+    different = int(np.bitwise_or.reduce(ints ^ ints[0])) # a one for every bit where any address doesn't match the first address
+    count = 32 - different.bit_length() # the bits before the first one match in every address
+
+    supernet = str(addresses[min_address(ints)]) + '/' + str(count) # combine the smallest address with the count
     
     return supernet, count # return the supernet in CIDR notation, and the count (host bits)
 
+# the number of network bits of a network address of each class when no prefix is given, class D and E addresses are single addresses
+CLASS_PREFIXES = np.array([8, 16, 24, 32, 32])
+
+# function to return the smallest list of CIDR blocks that covers exactly the same addresses as the networks given (route summarization)
+# each network can be in CIDR notation like "10.1.0.0/16", or just an address, which means the whole network of its class
+def summarize(networks):
+    networks = [str(network).partition('/') for network in networks] # (address, '/', prefix), the prefix is blank if there isn't one
+    ints = address_ints([address for address, _, _ in networks]).astype(np.int64)
+    prefixes = CLASS_PREFIXES[np.searchsorted(BATCH_BOUNDARIES, ints >> 24, side='right')] # the class of each address
+    for i, (address, slash, prefix) in enumerate(networks):
+        if slash: # the prefix was given
+            if not prefix.isdigit() or int(prefix) > 32:
+                raise HTTPException(status_code=400, detail="Not a prefix length: {}".format(prefix))
+            prefixes[i] = int(prefix)
+    sizes = np.left_shift(1, 32 - prefixes, dtype=np.int64) # the number of addresses in each network
+    starts = ints & -sizes # the first address of each network
+    ends = starts + sizes - 1
+
+    order = np.argsort(starts, kind='stable') # sort the networks, then join the ones that overlap or touch
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends) # the last address covered by this network or any before it
+    new_range = np.ones(len(starts), dtype=bool)
+    new_range[1:] = starts[1:] > reach[:-1] + 1 # a gap before this network, so it starts a new range
+    range_starts = starts[new_range]
+    range_ends = reach[np.append(np.flatnonzero(new_range)[1:] - 1, len(starts) - 1)] # the reach at the last network of each range
+
+    blocks = []
+    for start, end in zip(range_starts.tolist(), range_ends.tolist()): # cut each range into the biggest blocks that fit
+        while start <= end:
+            size = min((start & -start) or 1 << 32, 1 << ((end - start + 1).bit_length() - 1)) # a block must start on a multiple of its size
+            blocks.append((start, 33 - size.bit_length()))
+            start += size
+    return blocks
+
 # function to return the network mask
 def network_mask(count): # function takes the count of the host bits
-    binary_mask = ('1' * count) + ('0' * (32 - count)) # create the network mask in binary using the no. of host bits
+    return MASK_TEXTS[count] # every mask was made when the server started
     
-    network_mask = '' # create a string to hold the network mask
-    i = 0
-    while i < 4: # loop through the address
-        network_mask += str(int(binary_mask[(8 * i) : (8 * (i + 1))], base=2)) # take the address in groups of eight, convert to int, add to string
-        network_mask += '.' # add a '.' to seperate the numbers
-        i += 1
-
-    network_mask = network_mask[:-1] # remove the last '.' from the address
-    return network_mask
-
 @app.post("/supernet", tags=['supernet'])
 async def supernet(item: SupernetItem):
+    if item.summarize: # return the smallest list of blocks instead of one supernet
+        return {
+            "blocks": [{"address": to_text(start) + '/' + str(count), "mask": network_mask(count)} for start, count in summarize(item.addresses)]
+        }
     supernet, count = supernet_cidr(item.addresses)
     # return in JSON the supernet address and mask
     return {
         "address": '{}'.format(supernet),
 	    "mask": '{}'.format(network_mask(count))
     }
+
+#------------------------------------------------------------------------------
+
+prefix_index = PrefixIndex() # the loaded prefix table, replaced as a whole when a new table is loaded
+
+# function to turn one address into a 32 bit integer, with a 400 error if it isn't an address
+def address_int(address):
+    numbers = address.split('.')
+    if len(numbers) != 4 or not all(number.isdigit() and len(number) <= 3 and int(number) <= 255 for number in numbers):
+        raise HTTPException(status_code=400, detail="Not an IP address: {}".format(address))
+    return to_int(address)
+
+@app.post("/prefixes", tags=['prefixes'])
+def prefixes(item: PrefixTableItem):
+    global prefix_index
+    try:
+        index = PrefixIndex(item.prefixes)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail="Not prefixes: {}".format(error.args[0]))
+    prefix_index = index # lookups already running keep using the old table
+    return {"prefixes": len(index), "ranges": index.ranges()}
+
+@app.post("/prefixes/lookup", tags=['prefixes'])
+async def prefixlookup(item: PrefixLookupItem):
+    found = prefix_index.lookup(address_int(item.address))
+    return {
+        "address": item.address,
+        "prefix": prefix_index.text(found) if found >= 0 else None # None if no prefix in the table covers the address
+    }
+
+@app.post("/prefixes/lookup/batch", tags=['prefixes'])
+def prefixlookupbatch(item: BatchIPcalcItem):
+    index = prefix_index
+    ints, valid = parse_addresses(item.addresses)
+    found = np.where(valid, index.lookup_many(ints), -1).tolist()
+    texts = {i: index.text(i) for i in set(found) if i >= 0} # each prefix is written out once however many addresses fall in it
+    return {"prefixes": [texts.get(i) for i in found]} # in the order of the addresses, None for no match or an invalid address
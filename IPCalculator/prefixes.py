@@ -0,0 +1,75 @@
+# a table of prefixes that can say which prefix an address falls in (longest prefix match), one address at a time or a whole list at once
+# the prefixes are flattened into ranges of addresses that don't overlap, each owned by the longest prefix covering it, so a lookup
+# is one binary search
+from array import array
+from bisect import bisect_right
+
+import numpy as np
+
+from addresses import parse_addresses, to_text
+
+LENGTHS = {str(length): length for length in range(33)} # the text of every prefix length, for reading a million prefixes quickly
+
+# function to turn a list of prefixes in CIDR notation like "10.1.0.0/16" into arrays of their first addresses and lengths
+# any bits of the address past the prefix length are cleared, so "10.1.2.3/16" is the same as "10.1.0.0/16"
+# raises ValueError listing the entries that aren't prefixes
+def parse_prefixes(prefixes):
+    parts = [str(prefix).partition('/') for prefix in prefixes] # (address, '/', length)
+    ints, valid = parse_addresses([address for address, _, _ in parts])
+    lengths = np.array([LENGTHS.get(length, -1) for _, _, length in parts], dtype=np.int64)
+    valid &= lengths >= 0
+    if not valid.all():
+        raise ValueError([prefixes[i] for i in np.flatnonzero(~valid)[:10]])
+    sizes = np.left_shift(1, 32 - lengths, dtype=np.int64)
+    return ints.astype(np.int64) & -sizes, lengths
+
+class PrefixIndex:
+
+    def __init__(self, prefixes=()):
+        networks, lengths = parse_prefixes(list(prefixes))
+        keys = np.unique((networks << 6) | lengths) # sorted by first address, then shortest first so a prefix comes before the ones inside it, and without repeats
+        self.networks = array('I', (keys >> 6).tolist()) # the first address of each prefix
+        self.lengths = bytes((keys & 63).tolist()) # the length of each prefix
+        ends = ((keys >> 6) + np.left_shift(1, 32 - (keys & 63), dtype=np.int64) - 1).tolist() # the last address of each prefix
+        self._starts, self._owners = _ranges(self.networks, ends)
+        self._starts_array = np.frombuffer(self._starts, dtype=np.uint32) # the same memory, for searching a whole list at once
+
+    def __len__(self):
+        return len(self.networks)
+
+    def ranges(self): # the number of ranges the prefixes were flattened into
+        return len(self._starts)
+
+    def lookup(self, address): # the number of the longest prefix the address (a 32 bit integer) falls in, -1 if there isn't one
+        return self._owners[bisect_right(self._starts, address) - 1]
+
+    def lookup_many(self, addresses): # lookup for an array of addresses at once
+        return np.frombuffer(self._owners, dtype=np.int32)[np.searchsorted(self._starts_array, addresses, side='right') - 1]
+
+    def text(self, i): # prefix number i in CIDR notation
+        return to_text(self.networks[i]) + '/' + str(self.lengths[i])
+
+# function to flatten prefixes that are sorted by first address, shortest first, into ranges that don't overlap
+# returns the first address of each range and the number of the prefix that owns it, the first range always starts at 0
+def _ranges(networks, ends):
+    starts, owners = array('I', [0]), array('i', [-1]) # no prefix covers the addresses before the first one
+    stack = [] # the prefixes the current address is inside, longest last, as (last address, number)
+
+    def begin(address, owner): # start a new range, replacing the last one if it started at the same address
+        if starts[-1] == address:
+            owners[-1] = owner
+        else:
+            starts.append(address)
+            owners.append(owner)
+
+    for i, (network, end) in enumerate(zip(networks, ends)):
+        while stack and stack[-1][0] < network: # leave the prefixes that end before this one starts
+            last = stack.pop()[0]
+            begin(last + 1, stack[-1][1] if stack else -1) # the addresses after it belong to the prefix around it again
+        begin(network, i)
+        stack.append((end, i))
+    while stack:
+        last = stack.pop()[0]
+        if last < 0xFFFFFFFF:
+            begin(last + 1, stack[-1][1] if stack else -1)
+    return starts, owners
@@ -0,0 +1,181 @@
+# benchmark for the routing graph, run with: python benchmark.py --sizes 10000 50000 100000
+# time writes while many trees are cached with: python benchmark.py --sizes 10000 --writes 100 --warm-trees 200
+import argparse
+import random
+import time
+import tracemalloc
+
+from csr import CSRStorage
+from main import Graph
+
+STORAGES = {'dict': dict, 'csr': CSRStorage} # the storage backends the graph can use
+
+# random sparse graph with a given number of nodes and average degree
+def random_graph(num_nodes, degree, seed, storage='dict'):
+    rand = random.Random(seed)
+    graph = Graph(storage=STORAGES[storage]())
+    names = ['R' + str(i) for i in range(num_nodes)] # name the routers R0, R1, ...
+    for name in names:
+        graph.addNode(name)
+    for i in range(1, num_nodes): # join each router to an earlier one so the graph is connected
+        graph.addEdge(names[i], names[rand.randrange(i)], rand.randint(1, 100))
+    for _ in range(num_nodes * (degree - 2) // 2): # then add random extra links until the average degree is reached
+        graph.addEdge(names[rand.randrange(num_nodes)], names[rand.randrange(num_nodes)], rand.randint(1, 100))
+    return graph, names
+
+# routers scattered over a square and linked to their nearest neighbours, with weights set by distance, like a real network
+def geometric_graph(num_nodes, degree, seed, storage='dict'):
+    rand = random.Random(seed)
+    graph = Graph(storage=STORAGES[storage]())
+    names = ['R' + str(i) for i in range(num_nodes)]
+    points = [(rand.random(), rand.random()) for _ in range(num_nodes)]
+    cells = int((num_nodes / degree) ** 0.5) or 1 # a grid with about degree routers in each cell
+    grid = {}
+    for i, (x, y) in enumerate(points):
+        grid.setdefault((int(x * cells), int(y * cells)), []).append(i)
+    for name in names:
+        graph.addNode(name)
+    for i, (x, y) in enumerate(points): # link each router to its nearest routers in the cells around it
+        cx, cy = int(x * cells), int(y * cells)
+        near = [j for dx in (-1, 0, 1) for dy in (-1, 0, 1) for j in grid.get((cx + dx, cy + dy), []) if j != i]
+        near.sort(key=lambda j: (points[j][0] - x) ** 2 + (points[j][1] - y) ** 2)
+        for j in near[:degree // 2]:
+            distance = ((points[j][0] - x) ** 2 + (points[j][1] - y) ** 2) ** 0.5
+            graph.addEdge(names[i], names[j], int(distance * 10000) + 1)
+    return graph, names
+
+LAYOUTS = {'random': random_graph, 'geometric': geometric_graph}
+
+# the original list based version of shortest_path, kept here to compare against
+def legacy_shortest_path(graph, node1, node2):
+    visited = []
+    path, previous = {}, {}
+    for node in graph.nodes():
+        path[node] = float('inf')
+        previous[node] = ''
+    previous[node1] = node1
+    path[node1] = 0
+    i = 0
+    while i < len(path):
+        temp = {}
+        for node in path:
+            if node not in visited:
+                temp[node] = path[node]
+        curr = min(temp, key=temp.get)
+        visited.append(curr)
+        for node in path:
+            if node in graph.graph[curr]:
+                if path[curr] + graph.graph[curr][node] < path[node]:
+                    path[node] = path[curr] + graph.graph[curr][node]
+                    previous[node] = curr
+        i += 1
+    return path[node2] if path[node2] != float('inf') else -1
+
+# time random connection changes, half new or reweighted connections and half removed ones, in milliseconds per write
+# with warm trees cached first, so the time includes repairing them, or with an empty cache when warm is 0
+def time_writes(graph, names, count, warm, seed):
+    rand = random.Random(seed)
+    graph.cache_size = max(warm, 1)
+    graph._trees.clear()
+    for source in rand.sample(names, warm):
+        graph.tree(source)
+    changes = []
+    for _ in range(count): # picked up front so both runs make the same changes
+        node1, node2 = rand.sample(names, 2)
+        changes.append((node1, node2, rand.randint(1, 100), rand.random() < 0.5))
+    start = time.perf_counter()
+    for node1, node2, weight, add in changes:
+        if add or not graph.graph[node1]:
+            graph.addEdge(node1, node2, weight)
+        else:
+            graph.removeEdge(node1, next(iter(graph.graph[node1])))
+    return (time.perf_counter() - start) * 1000 / count
+
+# time a function over a list of (from, to) pairs and return the average time per query in milliseconds
+def time_queries(function, pairs):
+    start = time.perf_counter()
+    for node1, node2 in pairs:
+        function(node1, node2)
+    return (time.perf_counter() - start) * 1000 / len(pairs)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark shortest path queries on random sparse graphs.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 100000], help='number of routers in each graph')
+    parser.add_argument('--degree', type=int, default=4, help='average number of links per router')
+    parser.add_argument('--queries', type=int, default=20, help='number of random route queries per graph')
+    parser.add_argument('--legacy-limit', type=int, default=2000, help='largest graph the legacy version is timed on')
+    parser.add_argument('--storage', nargs='+', choices=sorted(STORAGES), default=['dict'], help='storage backends to compare')
+    parser.add_argument('--memory', action='store_true', help='also measure the memory used by each graph (slower)')
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='random', help='how the routers are linked together')
+    parser.add_argument('--algorithms', nargs='+', choices=['dijkstra', 'bidirectional', 'alt'], default=['dijkstra'], help='search algorithms to compare')
+    parser.add_argument('--k', type=int, nargs='*', default=[], help='also time the k shortest paths search for each of these k, e.g. --k 1 4 8 16 32')
+    parser.add_argument('--writes', type=int, default=0, help='also time this many connection changes, with and without cached trees')
+    parser.add_argument('--warm-trees', type=int, default=200, help='trees cached before timing the writes')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    sizes = sorted(set(args.sizes + [args.legacy_limit])) # always include a size small enough to time the legacy version on
+    for size in sizes:
+        for storage in args.storage:
+            run(size, storage, args)
+
+def run(size, storage, args):
+    start = time.perf_counter()
+    graph, names = LAYOUTS[args.layout](size, args.degree, args.seed, storage)
+    build_s = time.perf_counter() - start
+    rand = random.Random(args.seed)
+    pairs = [(rand.choice(names), rand.choice(names)) for _ in range(args.queries)]
+    graph.cache_size = 0 # time the searches themselves, not cache lookups
+    line = '{:>8} routers  {:>4}  build: {:7.2f} s'.format(size, storage, build_s)
+    if args.memory:
+        line += '  memory: {:8.1f} MB'.format(measure_memory(size, storage, args) / 2 ** 20)
+    print(line)
+    if 'alt' in args.algorithms:
+        start = time.perf_counter()
+        graph.build_landmarks() # worked out up front here, the service does this in the background
+        print('{:>30}  landmarks: {:7.2f} s'.format('', time.perf_counter() - start))
+    for algorithm in args.algorithms:
+        settled = []
+
+        def search(node1, node2):
+            stats = {}
+            graph.shortest_path(node1, node2, algorithm, stats)
+            settled.append(stats['settled'])
+
+        ms = time_queries(search, pairs)
+        line = '{:>30}  {:>13}: {:10.3f} ms/query  {:10.0f} settled/query'.format('', algorithm, ms, sum(settled) / len(settled))
+        if size <= args.legacy_limit and storage == args.storage[0] and algorithm == 'dijkstra':
+            legacy_pairs = pairs[:3] # the legacy version is quadratic so only time a few queries
+            legacy_ms = time_queries(lambda a, b: legacy_shortest_path(graph, a, b), legacy_pairs)
+            line += '  legacy: {:10.3f} ms/query  speedup: {:.0f}x'.format(legacy_ms, legacy_ms / ms)
+        print(line)
+    for k in args.k:
+        settled, found = [], []
+
+        def search(node1, node2):
+            stats = {}
+            found.append(len(graph.k_shortest_paths(node1, node2, k, stats)))
+            settled.append(stats['settled'])
+
+        ms = time_queries(search, pairs)
+        print('{:>30}  {:>13}: {:10.3f} ms/query  {:10.0f} settled/query  {:6.1f} paths/query'.format(
+            '', 'k={}'.format(k), ms, sum(settled) / len(settled), sum(found) / len(found)))
+    if args.writes:
+        cold_ms = time_writes(graph, names, args.writes, 0, args.seed)
+        warm_ms = time_writes(graph, names, args.writes, min(args.warm_trees, len(names)), args.seed + 1)
+        print('{:>30}  {:>13}: {:10.3f} ms/write cold  {:10.3f} ms/write with {} trees cached'.format(
+            '', 'writes', cold_ms, warm_ms, min(args.warm_trees, len(names))))
+
+# memory still held by a graph after it has been built, in bytes
+def measure_memory(size, storage, args):
+    tracemalloc.start()
+    graph, names = LAYOUTS[args.layout](size, args.degree, args.seed, storage)
+    if storage == 'csr':
+        graph.graph.compact() # merge the last changes into the arrays, as a long running graph would
+    del names
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used
+
+if __name__ == '__main__':
+    main()
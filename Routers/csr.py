@@ -0,0 +1,148 @@
+# compact storage for the routing graph, used in place of the dict of dicts with Graph(storage=CSRStorage())
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from copy import copy
+
+class CSRStorage(MutableMapping): # router name -> neighbours, with the connections kept in flat arrays
+
+    def __init__(self, compact_every=4096):
+        self._ids = {} # router name -> integer id
+        self._names = [] # integer id -> router name, None once the router is removed
+        self._offsets = array('q', [0]) # the connections of router i are at positions offsets[i] to offsets[i+1] (CSR layout)
+        self._targets = array('i') # id of the router at the other end of each connection, sorted within each router
+        self._weights = array('q') # weight of each connection (weights are whole numbers, like EdgeWeightItem)
+        self._delta = {} # id -> {id: weight} changes since the last compaction, None marks a removed connection
+        self._pending = 0 # number of changes waiting in the delta
+        self._edges = 0 # number of connections in the arrays, counted once per direction
+        self.compact_every = compact_every # minimum number of changes before the delta is merged into the arrays
+
+    def __getitem__(self, node): # the neighbours of a router
+        return _CSRNeighbours(self, self._ids[node])
+
+    def __setitem__(self, node, edges): # add a router, or replace the connections of an existing one
+        if node in self._ids:
+            self._clear(self._ids[node])
+        else:
+            self._ids[node] = len(self._names)
+            self._names.append(node)
+        neighbours = self[node]
+        for other, weight in edges.items():
+            neighbours[other] = weight
+
+    def __delitem__(self, node): # remove a router, its id is not reused until the next compaction
+        rid = self._ids.pop(node)
+        self._names[rid] = None
+        self._clear(rid)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, node):
+        return node in self._ids
+
+    def _clear(self, rid): # mark every connection of a router as removed
+        delta = self._delta.setdefault(rid, {})
+        for other, _ in self._row(rid):
+            delta[other] = None
+            self._pending += 1
+        self._maybe_compact()
+
+    def _row(self, rid): # yield (id, weight) for every current connection of a router
+        delta = self._delta.get(rid)
+        if rid < len(self._offsets) - 1: # routers added since the last compaction have nothing in the arrays
+            targets, weights = self._targets, self._weights
+            for i in range(self._offsets[rid], self._offsets[rid + 1]):
+                if delta is None or targets[i] not in delta: # the delta overrides the arrays
+                    yield targets[i], weights[i]
+        if delta:
+            for other, weight in delta.items():
+                if weight is not None:
+                    yield other, weight
+
+    def _lookup(self, rid, other): # the weight of one connection, or None if there isn't one
+        delta = self._delta.get(rid)
+        if delta is not None and other in delta:
+            return delta[other]
+        if rid < len(self._offsets) - 1:
+            lo, hi = self._offsets[rid], self._offsets[rid + 1]
+            i = bisect_left(self._targets, other, lo, hi) # the targets of each router are sorted so we can binary search them
+            if i < hi and self._targets[i] == other:
+                return self._weights[i]
+        return None
+
+    def _set(self, rid, other, weight): # record a change to one direction of a connection
+        self._delta.setdefault(rid, {})[other] = weight
+        self._pending += 1
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._pending > max(self.compact_every, self._edges // 4): # compact once the delta is a fair share of the arrays
+            self.compact()
+
+    def compact(self): # merge the delta into new arrays, dropping removed routers
+        live = [rid for rid, name in enumerate(self._names) if name is not None]
+        new_ids = {rid: i for i, rid in enumerate(live)} # number the remaining routers from zero again
+        offsets, targets, weights = array('q', [0]), array('i'), array('q')
+        for rid in live:
+            row = sorted((new_ids[other], weight) for other, weight in self._row(rid) if other in new_ids) # skip links to removed routers
+            for other, weight in row:
+                targets.append(other)
+                weights.append(weight)
+            offsets.append(len(targets))
+        self._names = [self._names[rid] for rid in live]
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        self._offsets, self._targets, self._weights = offsets, targets, weights
+        self._delta = {}
+        self._pending = 0
+        self._edges = len(targets)
+
+    def freeze(self): # a copy for readers that later changes don't affect
+        frozen = copy(self) # the arrays are shared, they are never changed in place, compaction builds new ones
+        frozen._ids = dict(self._ids)
+        frozen._names = list(self._names)
+        frozen._delta = {rid: dict(row) for rid, row in self._delta.items()}
+        return frozen
+
+    def nbytes(self): # memory used by the arrays, for comparing against the dict storage
+        return sum(a.itemsize * len(a) for a in (self._offsets, self._targets, self._weights))
+
+class _CSRNeighbours(MutableMapping): # the neighbours of one router, looks like the inner dict of the dict storage
+
+    def __init__(self, storage, rid):
+        self._storage = storage
+        self._id = rid
+
+    def __getitem__(self, node):
+        weight = self._storage._lookup(self._id, self._storage._ids[node])
+        if weight is None:
+            raise KeyError(node)
+        return weight
+
+    def __setitem__(self, node, weight):
+        self._storage._set(self._id, self._storage._ids[node], weight)
+
+    def __delitem__(self, node):
+        self[node] # raise a KeyError if there is no connection, like a dict would
+        self._storage._set(self._id, self._storage._ids[node], None)
+
+    def __contains__(self, node):
+        other = self._storage._ids.get(node)
+        return other is not None and self._storage._lookup(self._id, other) is not None
+
+    def __iter__(self):
+        names = self._storage._names
+        return (names[other] for other, _ in self._storage._row(self._id))
+
+    def __len__(self):
+        return sum(1 for _ in self._storage._row(self._id))
+
+    def items(self): # one pass over the row instead of a lookup per neighbour
+        names = self._storage._names
+        return [(names[other], weight) for other, weight in self._storage._row(self._id)]
+
+    def keys(self): # lets dict(neighbours) copy the row in one pass
+        return list(self)
@@ -0,0 +1,107 @@
+# randomized check of the cached tree repair, run with: python fuzz.py --rounds 200 --storage dict csr
+# makes random changes to a small network with every tree cached, and after each one checks that every repaired tree has the
+# same distances as a fresh search and is a real shortest path tree, and that a tree a reader took before the change is unchanged
+import argparse
+import random
+import sys
+
+from benchmark import STORAGES
+from main import Graph
+
+# function to return the problems with a cached tree, compared with a fresh search of the same network, as a list of strings
+def tree_problems(graph, network, source, path, previous):
+    problems = []
+    fresh, _ = graph._dijkstra(network, source)
+    if dict(path.items()) != fresh:
+        wrong = sorted(set(fresh.items()) ^ set(path.items()), key=str)[:5]
+        problems.append('distances from {} differ from a fresh search: {}'.format(source, wrong))
+    if set(path) != set(previous) or len(path) != len(list(path)):
+        problems.append('tree from {} has different routers in path and previous'.format(source))
+    for node in path:
+        if node == source:
+            continue
+        before = previous.get(node)
+        if before not in path or node not in network[before] or path[before] + network[before][node] != path[node]:
+            problems.append('tree from {} reaches {} through {}, which is not a shortest path'.format(source, node, before))
+            break
+    return problems
+
+# function to make one random change to the network, returns a description of it
+def random_change(graph, rand, names):
+    nodes = graph.nodes()
+    choice = rand.random()
+    if choice < 0.4 and len(nodes) > 1: # a new connection, or a new weight for one that is there, cheaper or dearer
+        node1, node2 = rand.sample(nodes, 2)
+        weight = rand.randint(0, 20)
+        graph.addEdge(node1, node2, weight)
+        return 'addEdge {} {} {}'.format(node1, node2, weight)
+    if choice < 0.75: # remove a connection
+        node1 = rand.choice(nodes)
+        if graph.graph[node1]:
+            node2 = rand.choice(list(graph.graph[node1]))
+            graph.removeEdge(node1, node2)
+            return 'removeEdge {} {}'.format(node1, node2)
+    if choice < 0.9 and len(nodes) > 3: # remove a few routers at once
+        removed = rand.sample(nodes, rand.randint(1, 3))
+        graph.removeNodes(removed)
+        return 'removeNodes {}'.format(removed)
+    name = 'R' + str(len(names)) # a new router, linked to the network so later changes can reach it
+    names.append(name)
+    graph.addNode(name)
+    graph.addEdge(name, rand.choice(nodes), rand.randint(0, 20))
+    return 'addNode {}'.format(name)
+
+# function to run one round of random changes, returns the problems found
+def run_round(storage, seed, args):
+    rand = random.Random(seed)
+    graph = Graph(storage=STORAGES[storage]())
+    names = ['R' + str(i) for i in range(args.routers)]
+    for name in names:
+        graph.addNode(name)
+    for _ in range(args.routers * args.degree // 2):
+        node1, node2 = rand.sample(names, 2)
+        graph.addEdge(node1, node2, rand.randint(0, 20))
+    for step in range(args.changes):
+        version, network = graph._current()
+        for source in network: # every tree is cached, so every change has trees to repair
+            graph.tree(source, (version, network))
+        source = rand.choice(list(network)) # a tree a reader is still walking while the change is made
+        held = graph.tree(source, (version, network))
+        snapshot = (dict(held[0].items()), dict(held[1].items()))
+        change = random_change(graph, rand, names)
+        if (dict(held[0].items()), dict(held[1].items())) != snapshot:
+            return ['round {} step {} ({}): the tree from {} changed under a reader'.format(seed, step, change, source)]
+        version, network = graph._current()
+        for source, (tree_version, path, previous) in list(graph._trees.items()):
+            if tree_version != version:
+                continue
+            problems = tree_problems(graph, network, source, path, previous)
+            if problems:
+                return ['round {} step {} ({}): {}'.format(seed, step, change, problem) for problem in problems]
+    return []
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the repaired shortest path trees against fresh searches.')
+    parser.add_argument('--rounds', type=int, default=100, help='random networks to try for each storage')
+    parser.add_argument('--routers', type=int, default=30, help='routers in each network')
+    parser.add_argument('--degree', type=int, default=3, help='average number of links per router')
+    parser.add_argument('--changes', type=int, default=40, help='random changes made to each network')
+    parser.add_argument('--storage', nargs='+', choices=sorted(STORAGES), default=sorted(STORAGES), help='storage backends to check')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    failed = False
+    for storage in args.storage:
+        problems = []
+        for i in range(args.rounds):
+            problems = run_round(storage, args.seed + i, args)
+            if problems:
+                break
+        print('{:>4}: {}'.format(storage, 'ok, {} rounds of {} changes'.format(args.rounds, args.changes) if not problems else 'FAILED'))
+        for problem in problems:
+            print('      ' + problem)
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
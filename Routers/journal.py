@@ -0,0 +1,107 @@
+# keeps the network on disk so it survives a restart: an append-only log of every change, plus snapshots of the whole network
+import json
+import mmap
+import os
+import struct
+
+MAGIC = b'RTSN' # first four bytes of every snapshot file
+HEADER = struct.Struct('<4sIQIQ') # magic, format version, last log number in the snapshot, number of routers, number of connections
+NAME = struct.Struct('<I') # length of a router name in bytes, followed by the name in utf-8
+EDGE = struct.Struct('<IIq') # the two router numbers and the weight of a connection
+OPS = {'addNode', 'addEdge', 'removeNode', 'removeEdge'} # the Graph methods that are logged
+
+class Journal:
+
+    def __init__(self, directory, snapshot_every=100000):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, 'snapshot.bin')
+        self.log_path = os.path.join(directory, 'log.ndjson')
+        self.snapshot_every = snapshot_every # write a new snapshot after this many changes
+        self.seq = 0 # number of the last change written
+        self._since_snapshot = 0 # changes written since the last snapshot
+        self._log = None # the log file, opened once the graph has been restored
+        os.makedirs(directory, exist_ok=True)
+
+    def restore(self, graph): # load the latest snapshot into the graph and replay the changes logged after it
+        with graph.batch():
+            self.seq = self._load_snapshot(graph)
+            clean = self._replay(graph)
+        if clean:
+            self._log = open(self.log_path, 'a', encoding='utf-8')
+        else: # start a new log rather than appending after a broken line
+            self.snapshot(graph)
+
+    def append(self, graph, op, *args): # write one change to the log, and take a snapshot when enough have built up
+        self.seq += 1
+        self._log.write(json.dumps([self.seq, op, *args]) + '\n')
+        self._log.flush() # hand the line to the operating system so it survives the process crashing
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot(graph)
+
+    def snapshot(self, graph): # write the whole network to a new snapshot and start a new log
+        ids = {node: i for i, node in enumerate(graph.graph)}
+        edges = [(ids[node], ids[other], weight) for node in graph.graph for other, weight in graph.graph[node].items()
+                 if ids[node] <= ids[other]] # each connection is stored in both directions, only write it once
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, 1, self.seq, len(ids), len(edges)))
+            for node in ids:
+                name = node.encode('utf-8')
+                f.write(NAME.pack(len(name)))
+                f.write(name)
+            for edge in edges:
+                f.write(EDGE.pack(*edge))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path) # swap the new snapshot in, so a crash never leaves half a snapshot
+        if self._log is not None: # the changes in the log are now in the snapshot, so start it again
+            self._log.close()
+        self._log = open(self.log_path, 'w', encoding='utf-8')
+        self._since_snapshot = 0
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def _load_snapshot(self, graph): # read the snapshot through a memory map, returns the last log number it contains
+        if not os.path.exists(self.snapshot_path) or os.path.getsize(self.snapshot_path) == 0:
+            return 0
+        with open(self.snapshot_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, seq, num_nodes, num_edges = HEADER.unpack_from(data, 0)
+            if magic != MAGIC or version != 1:
+                raise ValueError('{} is not a routing snapshot'.format(self.snapshot_path))
+            offset = HEADER.size
+            names = []
+            for _ in range(num_nodes):
+                (length,) = NAME.unpack_from(data, offset)
+                offset += NAME.size
+                names.append(str(data[offset:offset + length], 'utf-8'))
+                offset += length
+            for name in names:
+                graph.graph[name] = {}
+            view = memoryview(data)[offset:offset + num_edges * EDGE.size]
+            for node1, node2, weight in EDGE.iter_unpack(view): # unpack the connections straight out of the mapped file
+                graph.graph[names[node1]][names[node2]] = weight
+                graph.graph[names[node2]][names[node1]] = weight
+            view.release()
+        return seq
+
+    def _replay(self, graph): # apply the changes logged after the snapshot, returns False if the log ends with a broken line
+        if not os.path.exists(self.log_path):
+            return True
+        with open(self.log_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    seq, op, *args = json.loads(line)
+                except ValueError: # the last line may be cut short if the process crashed while writing it
+                    return False
+                if op not in OPS:
+                    raise ValueError('unknown operation {!r} in {}'.format(op, self.log_path))
+                if seq <= self.seq: # already in the snapshot
+                    continue
+                getattr(graph, op)(*args)
+                self.seq = seq
+                self._since_snapshot += 1
+        return True
@@ -1,5 +1,23 @@
+import heapq
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import List, Literal
+
 from pydantic import BaseModel, Field
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from csr import CSRStorage
+from journal import Journal
+from metrics import Metrics, MetricsMiddleware
+from trees import copy_tree
 
 description = """
 The second networks assignment recreates a network of routers, and allows the user to add and remove routers and create and remove connections between
@@ -29,7 +47,7 @@ and the router A wasn't already in the network, they would receive the response:
 The addconnection endpoint takes two routers that must already be part of the network, and creates a connection between them.
 If there is already an existing connection, the endpoint will update the connection with a new weight for the connection. The user will 
 enter the name of the first router, the name of the second router, and the weight of the connection between them, and the endpoint will return 
-the status of the action.
+the status of the action. Weights can't be negative.
 
 For example if the user entered the POST request:
 `{
@@ -65,6 +83,15 @@ The endpoint will remove the router from the network and return the status
 Even if the router is not in the network, the status of the action will still be "success", since the user has still achieved what
 they want, wish is to not have that router in the network.
 
+The removerouters endpoint does the same for a batch of routers at once. The user enters a list of router names, for example:
+`{
+    "names": ["D", "E"]
+}`,
+and the endpoint removes every router in the list and all of their connections, then returns
+`{
+    "status": "success"
+}`. As with removerouter, routers that aren't in the network are ignored.
+
 ## 4. Remove a Connection between two Routers
 The removeconnection endpoint takes two routers and removes the connection that exists between them in the network. The user enters 
 the two routers that they want to disconnect, and the endpoint returns the status of the action.
@@ -117,6 +144,115 @@ The endpoint would return:
 If there is no path between the routers, or if one or both of the routers aren't in the network, the endpoint will return the weight of 
 the path as -1, and the path taken is an empty list. If the start and end router are both the same, the endpoint will return the weight of 0 
 for the path, and a list containing only the router, to show that no path has been taken.
+
+The request can also say which search to use with an `"algorithm"` field. All three give the same weight, but on large networks the 
+last two look at far fewer routers:
+* `"dijkstra"` (the default) works out the shortest paths from the first router to every router and keeps them, so later requests 
+from the same router are answered straight away.
+* `"bidirectional"` searches outwards from both routers at once and stops when the two searches meet.
+* `"alt"` uses the distances to a set of landmark routers to steer the search towards the second router. The landmarks are worked out in the 
+background. They are kept when connections are only removed or made dearer, and worked out again (at most every few seconds) once a 
+connection is added or made cheaper. Until they are ready the endpoint uses the bidirectional search instead.
+
+For example:
+`{
+  "from": "A",
+  "to": "C",
+  "algorithm": "bidirectional"
+}`
+
+To see where the time of a request goes, add `"profile": true` to the request. The response then has a `"profile"` field with the search 
+that was used, the number of routers settled and connections relaxed, whether a cached tree was used, and how many milliseconds the 
+search, building the path, and the whole lookup took. It is empty if no search was needed.
+
+## 6. Multipath Routes
+The multipath endpoint is for spreading traffic over more than one path. The user enters two routers and the number of paths they want, 
+`k` (between 1 and 64, 4 if it is left out). The endpoint returns the weight of the shortest path, every neighbour of the first router 
+that is on a shortest path to the second router and closer to it (the equal cost next hops), and the k shortest paths that don't visit 
+a router twice, shortest first. A neighbour joined by a connection with weight 0 that is no closer to the second router is not a next 
+hop, so traffic can't loop between the two.
+
+For example:
+`{
+  "from": "A",
+  "to": "C",
+  "k": 2
+}`
+would return:
+`{
+  "from": "A",
+  "to": "C",
+  "weight": 7,
+  "next_hops": ["D"],
+  "paths": [
+    {"weight": 7, "route": [...]},
+    {"weight": 8, "route": [...]}
+  ]
+}`
+If there is no path between the routers the weight is -1 and both lists are empty.
+
+## 7. Batch Routes
+The routes endpoint finds the shortest paths between many pairs of routers in one request. The user enters a list of pairs, and the 
+endpoint returns a list with one result for each pair, in the same order and in the same form that the route endpoint returns. Pairs that 
+start at the same router share one search, so asking for the paths from one router to thousands of others costs about the same as asking 
+for one. When the pairs start at a lot of different routers, the searches are spread across the cores of the server.
+
+For example:
+`{
+  "routes": [
+    {"from": "A", "to": "C"},
+    {"from": "A", "to": "B"}
+  ]
+}`
+would return:
+`[
+  {"from": "A", "to": "C", "weight": 7, "route": [...]},
+  {"from": "A", "to": "B", "weight": 3, "route": [...]}
+]`
+
+## 8. Bulk Import
+The import endpoint builds a large network in one request instead of one request per router and connection. The body of the request is 
+a topology file with one router or connection per line. A line can either be JSON like the bodies of addrouter and connect, or a space 
+separated line with a router name or two router names and a weight. Blank lines and lines starting with `#` are skipped. For example:
+`{"name": "A"}
+{"name": "B"}
+C
+{"from": "A", "to": "B", "weight": 6}
+B C 5`
+
+The lines are applied in order, as if they had been sent to addrouter and connect. The file is saved to a temporary file on disk as it 
+arrives, so large files don't have to fit in memory and a slow upload doesn't stop other changes to the network, and once all of it is 
+there it is applied as one change. If the upload is cut off nothing is applied. The endpoint returns the number of lines applied, how 
+many lines got each status, and the line number and status of the first 100 lines that failed:
+`{
+  "status": "success",
+  "lines": 5,
+  "counts": {"success": 4, "Error, router does not exist": 1},
+  "errors": [{"line": 5, "status": "Error, router does not exist"}]
+}`
+
+## 9. Routing Tables
+The routingtable endpoint returns the forwarding table of every router in the network. It takes no input, and for each router it returns 
+the next router to send traffic to and the total weight of the path for every other router it can reach. The tables are worked out in 
+parallel across the cores of the server and are streamed back one router per line (newline delimited JSON), so large networks don't have 
+to fit into one response.
+
+Each line looks like:
+`{
+  "router": "A",
+  "routes": [
+    {"to": "D", "next_hop": "D", "weight": 1},
+    {"to": "E", "next_hop": "D", "weight": 2},
+    {"to": "B", "next_hop": "D", "weight": 3},
+    {"to": "C", "next_hop": "D", "weight": 7}
+  ]
+}`
+
+## 10. Metrics
+The metrics endpoint is a GET request that returns counters and histograms in the Prometheus text format, so it can be scraped by 
+Prometheus. It includes the number of requests to each endpoint by status code, how long the requests took, the number of searches of 
+each kind with the routers settled and connections relaxed by them, the cache hits and misses for the shortest path trees, and the size 
+of the network.
 """
 # tags for the endpoints
 tags_metadata = [
@@ -132,6 +268,10 @@ tags_metadata = [
         "name": "Remove Router",
         "description": "Remove a router from your network."
     },
+    {
+        "name": "Remove Routers",
+        "description": "Remove a batch of routers from your network."
+    },
     {
         "name": "Remove Connection",
         "description": "Remove a connection between two routers."
@@ -140,6 +280,26 @@ tags_metadata = [
         "name": "Find Shortest Path",
         "description": "Find the shortest path between two routers in your network."
     },
+    {
+        "name": "Multipath Routes",
+        "description": "Find the equal cost next hops and the k shortest paths between two routers."
+    },
+    {
+        "name": "Batch Routes",
+        "description": "Find the shortest paths between many pairs of routers at once."
+    },
+    {
+        "name": "Bulk Import",
+        "description": "Add many routers and connections from a topology file."
+    },
+    {
+        "name": "Metrics",
+        "description": "See how busy and how fast the service is."
+    },
+    {
+        "name": "Routing Tables",
+        "description": "Get the forwarding table of every router in your network."
+    },
 ]
 
 app = FastAPI(
@@ -155,87 +315,670 @@ class RouterItem(BaseModel):
 class EdgeWeightItem(BaseModel):
     from_: str = Field(None, alias='from', title="First Router", example="A")
     to: str = Field(title="Second Router", example="B")
-    weight: int = Field(title="Weight of Connection", example=8)
+    weight: int = Field(ge=0, title="Weight of Connection", example=8) # a negative weight would make the shortest path searches loop forever
+
+# base model for end points that take a list of routers
+class RoutersItem(BaseModel):
+    names: List[str] = Field(title="Names of Routers", example=["A", "B"])
 
 # base model for endpoints that take an edge between two nodes
 class EdgeItem(BaseModel):
     from_: str = Field(None, alias='from', title="First Router", example="A")
     to: str = Field(title="Second Router", example="E")
 
+# base model for the route endpoint, the two routers and the search to use
+class RouteItem(EdgeItem):
+    algorithm: Literal['dijkstra', 'bidirectional', 'alt'] = Field('dijkstra', title="Search Algorithm", example="dijkstra")
+    profile: bool = Field(False, title="Return a Timing Breakdown", example=False)
+
+# base model for the multipath endpoint, the two routers and how many paths to return
+class MultipathItem(EdgeItem):
+    k: int = Field(4, ge=1, le=64, title="Number of Paths", example=4)
+
+# base model for the routes endpoint, a list of pairs of routers to find the paths between
+class RoutesItem(BaseModel):
+    routes: List[EdgeItem] = Field(title="Pairs of Routers", example=[{"from": "A", "to": "C"}, {"from": "A", "to": "B"}])
+
 class Graph: # a graph represents the network
+    # writers take the lock and change self.graph, and each finished write is a new version of the network.
+    # readers (route, routing tables) search a read only copy of a finished version, made the first time a reader
+    # asks for it. they never wait for a writer and never see a change that is only half done.
 
-    def __init__(self):
-        self.graph = {} # create a dictionary for the graph
+    def __init__(self, cache_size=1024, storage=None, cache_entries=4000000):
+        self.graph = {} if storage is None else storage # create a dictionary for the graph, or use the storage passed in (see csr.py)
+        self.version = 0 # topology version, increased every time a router or connection changes
+        self.cache_size = cache_size # how many shortest path trees to keep, 0 turns the cache off
+        self.cache_entries = cache_entries # how many routers all the cached trees can hold between them, about 50 bytes each
+        self.journal = None # when set, every change is also written to disk (see journal.py)
+        self.metrics = None # when set, searches and cache lookups are counted (see metrics.py)
+        self.lock = threading.RLock() # only one writer can change the graph at a time
+        self._cache_lock = threading.Lock() # protects the tree cache, which readers and writers share
+        self._trees = OrderedDict() # (version, path, previous) shortest path trees for each source router, least recently used first
+        self._copy_on_write = isinstance(self.graph, dict) # the dict storage shares the neighbour dicts with the published copies
+        self._fresh = set() # routers whose neighbour dict was copied since the last publish, so it can be changed in place
+        self._depth = 0 # how many writes are in progress, they can be nested (a batch calls addEdge)
+        self._batching = 0 # more than zero while changes are being applied as one batch
+        self._published = (self.version, self._freeze()) # the latest version of the network that readers search
+        self.num_landmarks = 16 # how many landmarks the alt search uses
+        self._landmarks = None # (version, distances from each landmark), built in the background
+        self._landmark_thread = None
+        self._landmark_started = float('-inf') # when the last landmark refresh started
+        self.landmark_interval = 5 # seconds between landmark refreshes, each one is a full search from every landmark
+        self._last_cheaper = 0 # the version made by the last write that added a connection or made one cheaper
 
     def addNode(self, node): # function to add a node to the graph
-        self.graph[node] = {} # set the value of the node to a blank dictionary
+        with self._writing():
+            if node in self.graph: # re-adding a router wipes its connections, so the cached trees can't be repaired
+                self._clear_trees = True
+            self.graph[node] = {} # set the value of the node to a blank dictionary
+            self._fresh.add(node)
+            self._log('addNode', node)
+            self._changed() # a new router has no connections so the cached trees stay correct
 
     def addEdge(self, node1, node2, weight): # function to create a weighted edge between to nodes
-        if node1 in self.graph and node2 in self.graph: # only works if both nodes are in the graph
-            self.graph[node1][node2] = weight # add each node to the other node's dictionary
-            self.graph[node2][node1] = weight # set the node' value to the edge weight
+        if weight < 0: # the searches and the tree repair assume no path gets shorter by going further
+            raise ValueError('weights can\'t be negative')
+        with self._writing():
+            if node1 in self.graph and node2 in self.graph: # only works if both nodes are in the graph
+                old = self.graph[node1].get(node2) # the weight before the update, None for a new connection
+                if old is None or weight < old:
+                    self._cheaper = True
+                self._edges(node1)[node2] = weight # add each node to the other node's dictionary
+                self._edges(node2)[node1] = weight # set the node' value to the edge weight
+                self._repair(node1, node2, old, weight)
+                self._log('addEdge', node1, node2, weight)
+                self._changed()
 
     def removeNode(self, node): # function to remove a node from the graph
-        if node in self.graph: # check if the node is in the dictionary
-            del self.graph[node] # if it is, delete it
-        for othernode in self.graph: # go through the other nodes in the graph
-            if node in self.graph[othernode]: # delete the node from the other node's dictionary as well
-                del self.graph[othernode][node]
+        self.removeNodes([node])
+
+    def removeNodes(self, nodes): # function to remove a batch of nodes from the graph
+        with self._writing():
+            nodes = [node for node in dict.fromkeys(nodes) if node in self.graph] # skip duplicates and nodes that aren't in the graph
+            for node in nodes:
+                self._old_trees.pop(node, None) # the tree rooted at the router is no longer needed
+                for othernode in list(self.graph[node]): # the graph is undirected, so only the node's own neighbours link back to it
+                    old = self._edges(node).pop(othernode)
+                    self._edges(othernode).pop(node, None) # delete the node from the other node's dictionary as well
+                    self._repair(node, othernode, old, None) # removing a router is the same as removing each of its connections
+                del self.graph[node] # finally delete the router itself
+                self._log('removeNode', node)
+            if nodes:
+                self._changed() # one new version for the whole batch
 
     def removeEdge(self, node1, node2): # function to remove an edge between two nodes
-        if node1 in self.graph[node2]: # if the node is in the other node's dictionary, delete it
-            del self.graph[node2][node1]
-        if node2 in self.graph[node1]: # repeat the other way around
-            del self.graph[node1][node2]
+        with self._writing():
+            if node1 in self.graph[node2]: # if the node is in the other node's dictionary, delete it
+                old = self._edges(node2).pop(node1)
+                self._edges(node1).pop(node2, None) # repeat the other way around
+                self._repair(node1, node2, old, None)
+                self._log('removeEdge', node1, node2)
+                self._changed()
+
+    @contextmanager
+    def _writing(self): # hold the writer lock, and finish a new version once the outermost write is done
+        with self.lock:
+            if not self._depth:
+                with self._cache_lock: # the trees that are correct for the network as it is before this write
+                    self._old_trees = {source: entry for source, entry in self._trees.items() if entry[0] == self.version}
+                self._new_trees = {} # (path, previous) of the trees this write has repaired, changed on copies
+                self._clear_trees = False # set when the trees can't be repaired and have to be dropped
+                self._cheaper = False # set when a connection is added or made cheaper, which the landmarks can't allow for
+                self._dirty = False # set once something has changed
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if not self._depth and self._dirty:
+                    self._commit()
+
+    def _commit(self): # finish a write as one new version of the network
+        with self._cache_lock:
+            self.version += 1 # a new version of the network
+            if self._cheaper:
+                self._last_cheaper = self.version
+            for source in list(self._trees):
+                entry = self._trees[source]
+                if not self._clear_trees and self._old_trees.get(source) is entry: # the tree was checked or repaired by this write
+                    path, previous = self._new_trees.get(source, (entry[1], entry[2]))
+                    self._trees[source] = (self.version, path, previous)
+                else: # built by a reader for an older version while the write was going on
+                    del self._trees[source]
+
+    def _current(self): # the version readers should search, publishing a copy of the latest one if no write is going on
+        if self._published[0] != self.version and self.lock.acquire(blocking=False): # never wait for a writer, use the older copy instead
+            try:
+                if not self._depth and self._published[0] != self.version: # a write on this thread may still be half done
+                    self._published = (self.version, self._freeze()) # readers switch to the new version in one step
+                    self._fresh.clear() # every neighbour dict is now shared with the published copy
+            finally:
+                self.lock.release()
+        return self._published
+
+    def _freeze(self): # a read only copy of the graph for readers
+        if self._copy_on_write:
+            return dict(self.graph) # only the outer dict is copied, the neighbour dicts are copied when a writer first changes them
+        return self.graph.freeze()
+
+    def _edges(self, node): # the neighbour dict of a node, copied first if readers might still be searching it
+        if self._copy_on_write and node not in self._fresh:
+            self.graph[node] = dict(self.graph[node])
+            self._fresh.add(node)
+        return self.graph[node]
+
+    def _log(self, op, *args): # write a change to the journal, if there is one
+        if self.journal is not None:
+            self.journal.append(self, op, *args)
+
+    def _changed(self): # called after every change to the topology
+        self._dirty = True # the new version is published when the write finishes
 
-    def shortest_path(self, node1, node2): # function to return the shortest path between two nodes using Dijkstra's Algorithm
-        visited = [] # create a list that will hold the nodes that have been visited
-        path, previous = {}, {} # create two dictionaries to hold the distance to each node and the node visited before it
+    def _repair(self, node1, node2, old, new): # function to update the cached trees after one connection changes
+        if self._batching: # the cache is rebuilt after a batch instead of being repaired one change at a time
+            return
+        for source, entry in self._old_trees.items():
+            path, previous = self._new_trees.get(source, (entry[1], entry[2]))
+            if new is not None and (old is None or new < old): # a new or cheaper connection can only make paths shorter
+                if self._shorter(path, node1, node2, new):
+                    path, previous = self._own_tree(source, path, previous)
+                    self._decrease(path, previous, node1, node2, new)
+            elif old is not None and (new is None or new > old): # a dearer or removed connection can only make paths longer
+                if self._in_tree(previous, node1, node2):
+                    path, previous = self._own_tree(source, path, previous)
+                    self._increase(path, previous, node1, node2)
 
-        for node in self.nodes(): # go through each node in the graph
-            path[node] = float('inf') # set the distance to each node to infinity
-            previous[node] = '' # set the previously visited node for each node to an empty string
+    def _own_tree(self, source, path, previous): # copy a cached tree before repairing it, since readers may be using it
+        if source not in self._new_trees: # only the changes are copied (see trees.py), not every router in the tree
+            self._new_trees[source] = (copy_tree(path), copy_tree(previous))
+        return self._new_trees[source]
 
-        previous[node1] = node1 # since were starting at the first node, set the previous node to itself
-        path[node1] = 0 # distance to the first node from itself is zero
+    def _shorter(self, path, node1, node2, weight): # check if a connection makes either of its ends closer to the source
+        return any(start in path and path[start] + weight < path.get(end, float('inf')) for start, end in ((node1, node2), (node2, node1)))
+
+    def _in_tree(self, previous, node1, node2): # check if a connection is part of the tree
+        return (previous.get(node2) == node1 and node2 != previous[node2]) or (previous.get(node1) == node2 and node1 != previous[node1])
+
+    def _decrease(self, path, previous, node1, node2, weight): # push shorter distances out from the updated connection
+        heap = []
+        for start, end in ((node1, node2), (node2, node1)): # the connection can be used in both directions
+            if start in path and path[start] + weight < path.get(end, float('inf')):
+                heap.append((path[start] + weight, 0, end, start))
+        count = 1
+        while heap:
+            dist, _, curr, prev = heapq.heappop(heap)
+            if dist >= path.get(curr, float('inf')): # skip entries that no longer improve the node
+                continue
+            path[curr] = dist
+            previous[curr] = prev
+            for node, w in self.graph[curr].items(): # only the neighbours of an improved node can improve as well
+                if dist + w < path.get(node, float('inf')):
+                    heapq.heappush(heap, (dist + w, count, node, curr))
+                    count += 1
+
+    def _increase(self, path, previous, node1, node2): # recompute the part of the tree below a dearer or removed connection
+        if previous.get(node2) == node1 and node2 != previous[node2]: # find which end of the connection hangs below the other in the tree
+            root = node2
+        elif previous.get(node1) == node2 and node1 != previous[node1]:
+            root = node1
+        else: # the connection is not part of the tree so no distance changes
+            return
+
+        affected = [root] # collect every router whose tree path goes through the connection
         i = 0
-        while i < len(path): # loop through the nodes
-            temp = {} # create a temp dictionary to find the node with the shortest path that hasn't been visited yet
-            for node in path: # go through each node
-                if node not in visited: # add the node to the temp dictionary if it hasn't been visited
-                    temp[node] = path[node]
-            curr = min(temp, key=temp.get) # find the node with the smallest distance value -> node to visit next
-
-            visited.append(curr) # add the node to the visited nodes
-            for node in path: # go through each node
-                if node in self.graph[curr]: # if the node is connected to the current node
-                    if path[curr] + self.graph[curr][node] < path[node]: # check if the new route to the node is shorter than the current distance
-                        path[node] = path[curr] + self.graph[curr][node] # update the distance if it is
-                        previous[node] = curr # since you have come to the node through the current node, that is the node you visited directly previously
+        while i < len(affected):
+            curr = affected[i]
+            for node in self.graph[curr]:
+                if previous.get(node) == curr and node in path and node != root:
+                    affected.append(node)
             i += 1
-        
-        if path[node2] == float('inf'): # if the distance is still infinity, there is no path to the fist node
+        for node in affected: # forget their distances so they can be worked out again
+            del path[node]
+            del previous[node]
+
+        heap = [] # start the search from the unaffected neighbours of the affected routers
+        count = 0
+        for node in affected:
+            for other, w in self.graph[node].items():
+                if other in path:
+                    heap.append((path[other] + w, count, node, other))
+                    count += 1
+        heapq.heapify(heap)
+        while heap: # dijkstra over the affected routers only
+            dist, _, curr, prev = heapq.heappop(heap)
+            if curr in path:
+                continue
+            path[curr] = dist
+            previous[curr] = prev
+            for node, w in self.graph[curr].items():
+                if node not in path:
+                    heapq.heappush(heap, (dist + w, count, node, curr))
+                    count += 1
+
+    @contextmanager
+    def batch(self): # apply a group of changes as one new version of the network
+        with self._writing():
+            self._batching += 1
+            self._clear_trees = True # repairing the trees for every change in a big batch costs more than rebuilding them
+            self._changed()
+            try:
+                yield self
+            finally:
+                self._batching -= 1
+
+    def load(self, lines, max_errors=100): # function to add routers and connections from an iterable of lines
+        # returns how many lines got each status, and the line number and status of the first max_errors lines that failed.
+        # every line is applied before this returns, so the writer lock is never left held by a caller that stops early
+        counts, errors = {}, []
+        with self.batch():
+            for number, line in enumerate(lines, 1): # the lines are read one at a time, so a file never has to fit in memory
+                status = self.load_line(line)
+                if status is None:
+                    continue
+                counts[status] = counts.get(status, 0) + 1
+                if status.startswith('Error') and len(errors) < max_errors: # the counts still include every line
+                    errors.append({'line': number, 'status': status})
+        return counts, errors
+
+    def load_line(self, line): # function to apply one line of a topology file and return its status
+        try:
+            if isinstance(line, bytes):
+                line = line.decode()
+            line = line.strip()
+            if not line or line.startswith('#'): # skip blank lines and comments
+                return None
+            item = _parse_line(line)
+        except ValueError: # also catches a line that isn't valid UTF-8
+            return "Error, invalid line"
+        if len(item) == 1: # a line with only a name adds a router, with the same statuses as /addrouter
+            if item[0] in self.graph:
+                return "Error, node already exists"
+            self.addNode(item[0])
+            return "success"
+        status = self.check(item[0], item[1]) # a line with two routers and a weight connects them, with the same statuses as /connect
+        self.addEdge(item[0], item[1], item[2])
+        return status
+
+    def shortest_path(self, node1, node2, algorithm='dijkstra', stats=None): # function to return the shortest path between two nodes
+        # algorithm is 'dijkstra' (cached trees), 'bidirectional' (search from both ends) or 'alt' (A* guided by landmarks)
+        # if stats is a dict, the search used, the number of nodes settled and edges relaxed, whether a cached tree
+        # was used, and how long the search and building the path took are written into it
+        if stats is None and self.metrics is None: # nothing to measure
+            return self._shortest_path(node1, node2, algorithm)
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        result = self._shortest_path(node1, node2, algorithm, stats)
+        stats['total_ms'] = (time.perf_counter() - start) * 1000
+        stats['path_ms'] = stats['total_ms'] - stats.get('search_ms', stats['total_ms'])
+        if self.metrics is not None and 'algorithm' in stats: # searches for routers that aren't in the network aren't counted
+            used = stats['algorithm']
+            self.metrics.inc('routers_searches_total', algorithm=used)
+            self.metrics.inc('routers_search_settled_nodes_total', stats['settled'], algorithm=used)
+            self.metrics.inc('routers_search_relaxed_edges_total', stats['relaxed'], algorithm=used)
+            self.metrics.observe('routers_search_duration_seconds', stats['total_ms'] / 1000, algorithm=used)
+        return result
+
+    def _shortest_path(self, node1, node2, algorithm, stats=None):
+        start = time.perf_counter() if stats is not None else 0
+        version, graph = self._current() # search the latest published version of the network
+        if node1 not in graph or node2 not in graph: # the routers may have been removed since the endpoint checked
+            return -1, []
+        if algorithm == 'alt':
+            landmarks = self._landmarks_for(version, graph)
+            if landmarks is None: # the landmarks for this version are still being worked out in the background
+                algorithm = 'bidirectional'
+        if algorithm == 'bidirectional':
+            weight, previous = self._bidirectional(graph, node1, node2, stats)
+        elif algorithm == 'alt':
+            weight, previous = self._astar(graph, node1, node2, landmarks, stats)
+        elif algorithm == 'dijkstra':
+            if self.cache_size > 0:
+                path, previous = self.tree(node1, (version, graph), stats) # look up (or build) the full tree for the first node
+            else:
+                path, previous = self._dijkstra(graph, node1, node2, stats) # run dijkstra from the first node, stopping once the second node is settled
+            weight = path.get(node2)
+        else:
+            raise ValueError('unknown algorithm {!r}'.format(algorithm))
+        if stats is not None:
+            stats['algorithm'] = algorithm # alt falls back to bidirectional while the landmarks are being built
+            stats['search_ms'] = (time.perf_counter() - start) * 1000
+
+        if weight is None: # if the second node was never reached, there is no path to the fist node
             return -1, [] # return a distance of -1 and an empty list that represents the path taken
-        else:   
-            nodes_list = [] # create a list to hold the path you travelled to get to the final node
-            tmp = node2 # create a tmp variable to hold the final node to go through the previous dict without changing the value of the node
-            while tmp != node1:
-                nodes_list.append(tmp) # go through the previous dictionary and add every node previously visited from the final node to the start
-                tmp = previous[tmp]
-            nodes_list.append(node1) # add the first node to the list
-            nodes_list.reverse() # reverse the list so its going from the first node to the final node
-            full_path = [] # create a list that will hold the final full path showing the weights and each step taken
-            i = 0
-            while i < len(nodes_list) - 1: # go through the list of nodes visited
-                full_path.append(
-                    {
-                        'from': nodes_list[i], # go from one node
-                        'to': nodes_list[i+1], # to the next
-                        'weight': self.graph[nodes_list[i]][nodes_list[i+1]] # add the weight of the edge between the two nodes
-                    }
-                )
-                i += 1
-            return path[node2], full_path # return the distance between the two nodes and the path taken between them
+        return weight, self._full_path(graph, previous, node1, node2) # return the distance between the two nodes and the path taken between them
+
+    def tree(self, source, published=None, stats=None): # function to return the shortest path tree from a node, using the cache when it is still current
+        version, graph = published or self._current()
+        with self._cache_lock:
+            cached = self._trees.get(source)
+            if cached is not None and cached[0] == version: # only use a tree built for the same version of the network
+                self._trees.move_to_end(source) # mark the tree as the most recently used
+                if stats is not None:
+                    stats.update(settled=0, relaxed=0, cache_hit=True) # nothing had to be searched
+                if self.metrics is not None:
+                    self.metrics.inc('routers_tree_cache_hits_total')
+                return cached[1], cached[2]
+        if self.metrics is not None and self.cache_size > 0:
+            self.metrics.inc('routers_tree_cache_misses_total')
+        path, previous = self._dijkstra(graph, source, stats=stats) # run the full search so the tree answers every destination
+        if stats is not None:
+            stats['cache_hit'] = False
+        if self.cache_size > 0:
+            with self._cache_lock:
+                if self.version == version: # don't cache a tree for a version that has been replaced
+                    self._trees[source] = (version, path, previous)
+                    self._trees.move_to_end(source)
+                    while len(self._trees) > self._cache_limit(): # drop the least recently used trees once the cache is full
+                        self._trees.popitem(last=False)
+        return path, previous
+
+    def _cache_limit(self): # how many trees fit in the cache, fewer on a big network as each tree has a router for every router
+        return max(1, min(self.cache_size, self.cache_entries // max(1, len(self.graph))))
+
+    def shortest_paths(self, pairs, processes=None, chunk_size=64): # function to return the shortest path of many (from, to) pairs at once
+        # pairs from the same router share one search tree, and when there are a lot of different routers to search from
+        # the trees are built across a process pool, like the routing tables. results come back in the same order as the pairs
+        published = self._current() # every pair is answered from the same version of the network
+        graph = published[1]
+        groups = {} # first router -> the second routers of its pairs
+        for node1, node2 in pairs:
+            if node1 in graph and node2 in graph:
+                groups.setdefault(node1, {})[node2] = None # a dict keeps each second router once, in order
+        processes = processes or os.cpu_count() or 1
+        if processes == 1 or len(groups) <= chunk_size: # not worth starting a pool for a few trees
+            found = {}
+            for source, targets in groups.items():
+                found[source] = dict(zip(targets, self._paths_from(source, targets, published)))
+        else:
+            tasks = [(source, list(targets)) for source, targets in groups.items()]
+            chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+            found = {}
+            with ProcessPoolExecutor(max_workers=processes, initializer=_start_worker, initargs=(graph,)) as pool: # each worker gets the network once
+                for chunk, rows in zip(chunks, pool.map(_route_rows, chunks)):
+                    for (source, targets), row in zip(chunk, rows):
+                        found[source] = dict(zip(targets, row))
+        return [found[node1][node2] if node1 in found and node2 in found[node1] else (-1, []) for node1, node2 in pairs]
+
+    def _paths_from(self, source, targets, published=None): # function to return the (weight, path) to each target from one shortest path tree
+        version, graph = published or self._current()
+        path, previous = self.tree(source, (version, graph)) # one search answers every target, and /route can use the cached tree too
+        return [(path[target], self._full_path(graph, previous, source, target)) if target in path else (-1, []) for target in targets]
+
+    def ecmp(self, node1, node2): # function to return the weight of the shortest path and every next hop from node1 that is on a shortest path to node2
+        version, graph = self._current()
+        if node1 not in graph or node2 not in graph:
+            return -1, []
+        to_target, _ = self.tree(node2, (version, graph)) # the network is undirected, so the tree from node2 gives every router's distance to it
+        if node1 not in to_target:
+            return -1, []
+        weight = to_target[node1]
+        hops = [other for other, w in graph[node1].items() if other in to_target and w + to_target[other] == weight and to_target[other] < weight]
+        return weight, hops # a neighbour is a next hop if going through it costs no more than the shortest path and it is closer to node2,
+        # so a connection with weight 0 can't send traffic back and forth between two routers that are the same distance away
+
+    def k_shortest_paths(self, node1, node2, k, stats=None): # function to return up to k loopless paths from node1 to node2, shortest first (yen's algorithm)
+        # every path is a list of (weight, path) like shortest_path. each new path is found by leaving an earlier one at a spur router
+        # and searching from there with A*, using the exact distances of the tree from node2 as the estimate, so a spur search only
+        # has to look at the routers near the connections that were blocked
+        version, graph = self._current()
+        if node1 not in graph or node2 not in graph:
+            return []
+        to_target, toward = self.tree(node2, (version, graph), stats) # toward[node] is the next router on the shortest path from node to node2
+        if node1 not in to_target:
+            return []
+        settled = stats['settled'] if stats is not None else 0
+        paths = [self._tree_path(toward, node1, node2)] # the shortest path comes straight out of the tree
+        weights = [to_target[node1]]
+        candidates = [] # heap of (weight, tie breaker, path) for paths that have been found but not yet returned
+        seen = {tuple(paths[0])}
+        count = 0
+        while len(paths) < k:
+            last = paths[-1]
+            root_weight = 0 # weight of last[:i + 1]
+            for i in range(len(last) - 1):
+                spur, root = last[i], last[:i + 1]
+                blocked = set(root) # the root routers can't be used again, or the path would have a loop
+                first = {path[i + 1] for path in paths if len(path) > i + 1 and path[:i + 1] == root} # connections out of the spur that earlier paths took
+                spur_weight, spur_path, spur_settled = self._spur_path(graph, spur, node2, to_target, toward, blocked, first)
+                settled += spur_settled
+                if spur_path is not None:
+                    path = root[:-1] + spur_path
+                    if tuple(path) not in seen:
+                        seen.add(tuple(path))
+                        heapq.heappush(candidates, (root_weight + spur_weight, count, path))
+                        count += 1
+                root_weight += graph[last[i]][last[i + 1]]
+            if not candidates: # there are fewer than k loopless paths
+                break
+            weight, _, path = heapq.heappop(candidates)
+            paths.append(path)
+            weights.append(weight)
+        if stats is not None:
+            stats['settled'] = settled
+        return [(weight, self._steps(graph, path)) for weight, path in zip(weights, paths)]
+
+    def _spur_path(self, graph, spur, target, to_target, toward, blocked, first): # A* from the spur to the target, avoiding the blocked routers and first connections
+        # returns (weight, list of routers, number of routers settled), or (None, None, settled) if the target can't be reached
+        inf = float('inf')
+        best, previous = {spur: 0}, {spur: None}
+        heap = [(to_target[spur], 0, spur)]
+        done = set()
+        count = 1
+        while heap:
+            _, _, curr = heapq.heappop(heap)
+            if curr in done:
+                continue
+            done.add(curr)
+            if curr != spur: # once the rest of the tree path is free, nothing left in the heap can beat it because the estimate is exact
+                tail = self._tree_path(toward, curr, target)
+                if not blocked.intersection(tail):
+                    head = []
+                    node = curr
+                    while node is not None:
+                        head.append(node)
+                        node = previous[node]
+                    head.reverse()
+                    return best[curr] + to_target[curr], head + tail[1:], len(done)
+            for node, weight in graph[curr].items():
+                if node in blocked or node in done or (curr == spur and node in first):
+                    continue
+                new_dist = best[curr] + weight
+                if new_dist < best.get(node, inf) and to_target.get(node, inf) != inf:
+                    best[node] = new_dist
+                    previous[node] = curr
+                    heapq.heappush(heap, (new_dist + to_target[node], count, node))
+                    count += 1
+        return None, None, len(done)
+
+    def _tree_path(self, toward, node, target): # the routers on the tree path from a node to the root of the tree
+        path = [node]
+        while node != target:
+            node = toward[node]
+            path.append(node)
+        return path
+
+    def routes(self, source): # function to return the next hop and distance from one node to every node it can reach
+        path, previous = self.tree(source)
+        hops = {} # the first router on the path to each node
+        for node in path:
+            if node == source or node in hops:
+                continue
+            chain = [] # walk back up the tree until we reach a node whose next hop is known, or a neighbour of the source
+            while node not in hops and previous[node] != source:
+                chain.append(node)
+                node = previous[node]
+            hop = hops.get(node, node) # a neighbour of the source is its own next hop
+            hops[node] = hop
+            for other in chain: # every node on the way shares the same next hop
+                hops[other] = hop
+        return [{'to': node, 'next_hop': hops[node], 'weight': path[node]} for node in path if node != source]
+
+    def routing_table(self, processes=None, chunk_size=64): # function to return the routes of every node, spread across a process pool
+        graph = self._current()[1] # the published copy never changes, so changes made while streaming don't mix in
+        return _routing_table(graph, processes or os.cpu_count() or 1, chunk_size) # a generator that yields one router at a time
+
+    def _dijkstra(self, graph, source, target=None, stats=None): # dijkstra's algorithm using a heap as the priority queue
+        path, previous = {}, {source: source} # distance to each settled node and the node visited before it
+        best = {source: 0} # the shortest distance found so far to each node that has been reached
+        heap = [(0, 0, source)] # heap of (distance, tie breaker, node), the counter stops python comparing node names
+        count = 1
+        while heap:
+            dist, _, curr = heapq.heappop(heap) # take the unvisited node with the smallest distance
+            if curr in path: # a node can be pushed more than once, skip the stale entries
+                continue
+            path[curr] = dist # the node is now settled, so its distance is final
+            if curr == target: # stop early once the node we are looking for is settled
+                break
+            for node, weight in graph[curr].items(): # only relax the edges of the current node
+                new_dist = dist + weight
+                if node not in path and new_dist < best.get(node, float('inf')): # check if the new route to the node is shorter
+                    best[node] = new_dist
+                    previous[node] = curr # the node is reached through the current node
+                    heapq.heappush(heap, (new_dist, count, node))
+                    count += 1
+        if stats is not None:
+            stats['settled'] = len(path)
+            stats['relaxed'] = count - 1 # every successful relaxation pushes one entry onto the heap
+        return path, previous # nodes missing from path could not be reached from the source
+
+    def _bidirectional(self, graph, source, target, stats=None): # dijkstra from both routers at once, stopping when the searches meet
+        dist = ({source: 0}, {target: 0}) # the best distance found so far from the source (forwards) and from the target (backwards)
+        previous = ({source: source}, {target: target}) # the node each search reached a node from
+        settled = (set(), set())
+        heaps = ([(0, 0, source)], [(0, 0, target)])
+        best, meet = (0, None) if source == target else (float('inf'), None) # length of the shortest path found, and the connection it crosses
+        count = 1
+        while heaps[0] and heaps[1] and heaps[0][0][0] + heaps[1][0][0] < best: # stop once no shorter path can be found
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1 # grow the search that is closer to its start
+            other = 1 - side
+            d, _, curr = heapq.heappop(heaps[side])
+            if curr in settled[side]:
+                continue
+            settled[side].add(curr)
+            for node, weight in graph[curr].items():
+                new_dist = d + weight
+                if node not in settled[side] and new_dist < dist[side].get(node, float('inf')):
+                    dist[side][node] = new_dist
+                    previous[side][node] = curr
+                    heapq.heappush(heaps[side], (new_dist, count, node))
+                    count += 1
+                if node in dist[other] and new_dist + dist[other][node] < best: # the two searches touch across this connection
+                    best = new_dist + dist[other][node]
+                    meet = (curr, node) if side == 0 else (node, curr) # (end on the forward side, end on the backward side)
+        if stats is not None:
+            stats['settled'] = len(settled[0]) + len(settled[1])
+            stats['relaxed'] = count - 1
+        if best == float('inf'):
+            return None, {}
+        path = {source: source} # join the two halves into one previous dictionary running from the source to the target
+        if meet is not None:
+            node = meet[0]
+            while node != source: # the forward half, back to the source
+                path[node] = previous[0][node]
+                node = previous[0][node]
+            path[meet[1]] = meet[0]
+            node = meet[1]
+            while node != target: # the backward half, on to the target
+                path[previous[1][node]] = node
+                node = previous[1][node]
+        return best, path
+
+    def _astar(self, graph, source, target, landmarks, stats=None): # A* search, using the landmarks to estimate the distance left
+        estimates = [(dists, dists[target]) for dists in landmarks if target in dists] # landmarks in another part of the network don't help
+        inf = float('inf')
+
+        def estimate(node): # the distance left to the target can't be less than the difference of their distances to any landmark
+            best = 0
+            for dists, to_target in estimates:
+                to_node = dists.get(node, inf)
+                if to_node == inf: # the node can't reach the landmark but the target can, so it can't reach the target
+                    return inf
+                best = max(best, abs(to_target - to_node))
+            return best
+
+        path, previous = {}, {source: source}
+        best = {source: 0}
+        heap = [(estimate(source), 0, source)]
+        count = 1
+        while heap:
+            _, _, curr = heapq.heappop(heap)
+            if curr in path:
+                continue
+            path[curr] = best[curr]
+            if curr == target:
+                break
+            for node, weight in graph[curr].items():
+                new_dist = best[curr] + weight
+                if node not in path and new_dist < best.get(node, inf):
+                    guess = estimate(node)
+                    if guess == inf:
+                        continue
+                    best[node] = new_dist
+                    previous[node] = curr
+                    heapq.heappush(heap, (new_dist + guess, count, node))
+                    count += 1
+        if stats is not None:
+            stats['settled'] = len(path)
+            stats['relaxed'] = count - 1
+        return path.get(target), previous
+
+    def build_landmarks(self, published=None): # pick landmarks spread across the network and work out their distances to every node
+        version, graph = published or self._current()
+        landmarks = []
+        closest = {} # distance from each node to its nearest landmark so far
+        node = next(iter(graph), None)
+        while node is not None and len(landmarks) < self.num_landmarks:
+            dists, _ = self._dijkstra(graph, node)
+            landmarks.append(dists)
+            for other in graph:
+                closest[other] = min(closest.get(other, float('inf')), dists.get(other, float('inf')))
+            # the next landmark is the node furthest from all of the others, staying in the parts of the network that already
+            # have a landmark until they are covered, so small separate islands don't use up the landmarks
+            reached = [other for other in closest if closest[other] != float('inf')]
+            node = max(reached, key=closest.get)
+            if closest[node] == 0: # every reached node is already a landmark, move on to a part of the network with none
+                node = next((other for other in closest if closest[other] == float('inf')), None)
+        self._landmarks = (version, landmarks)
+        return landmarks
+
+    def _landmarks_for(self, version, graph): # the landmarks for a version, starting a background refresh if they are out of date
+        # landmarks built for an older version still work if every change since then removed a connection or made one dearer:
+        # distances can only have grown, so the old ones still never overestimate the distance left, and the search stays exact
+        landmarks = self._landmarks
+        if landmarks is not None and self._last_cheaper <= landmarks[0] <= version:
+            return landmarks[1]
+        with self._cache_lock:
+            now = time.monotonic()
+            idle = self._landmark_thread is None or not self._landmark_thread.is_alive() # only one refresh at a time
+            if idle and now - self._landmark_started >= self.landmark_interval: # and not so often they slow down the requests
+                self._landmark_started = now
+                self._landmark_thread = threading.Thread(target=self.build_landmarks, args=((version, graph),), daemon=True)
+                self._landmark_thread.start()
+        return None
+
+    def _full_path(self, graph, previous, node1, node2): # function to turn the previous dictionary into the list of steps taken
+        nodes_list = [] # create a list to hold the path you travelled to get to the final node
+        tmp = node2 # create a tmp variable to hold the final node to go through the previous dict without changing the value of the node
+        while tmp != node1:
+            nodes_list.append(tmp) # go through the previous dictionary and add every node previously visited from the final node to the start
+            tmp = previous[tmp]
+        nodes_list.append(node1) # add the first node to the list
+        nodes_list.reverse() # reverse the list so its going from the first node to the final node
+        return self._steps(graph, nodes_list)
+
+    def _steps(self, graph, nodes_list): # function to turn a list of routers into the list of steps taken
+        full_path = [] # create a list that will hold the final full path showing the weights and each step taken
+        i = 0
+        while i < len(nodes_list) - 1: # go through the list of nodes visited
+            full_path.append(
+                {
+                    'from': nodes_list[i], # go from one node
+                    'to': nodes_list[i+1], # to the next
+                    'weight': graph[nodes_list[i]][nodes_list[i+1]] # add the weight of the edge between the two nodes
+                }
+            )
+            i += 1
+        return full_path
 
     def nodes(self): # function to return a list of the nodes in the graph
         return list(self.graph.keys()) # the nodes are the keys in the graph dictionary
@@ -248,8 +991,85 @@ class Graph: # a graph represents the network
         else: # there already is a connection between the nodes so the function will just update it
             return "updated" 
 
+# turn one line of a topology file into (name,) for a router or (from, to, weight) for a connection
+# lines can be JSON objects like the /addrouter and /connect bodies, or space separated like "A" and "A B 5"
+def _parse_line(line):
+    if line.startswith('{'):
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            raise ValueError(line)
+        if not isinstance(data, dict):
+            raise ValueError(line)
+        if set(data) == {'name'}:
+            item = (data['name'],)
+        elif set(data) == {'from', 'to', 'weight'}:
+            item = (data['from'], data['to'], data['weight'])
+        else:
+            raise ValueError(line)
+    else:
+        item = tuple(line.split())
+        if len(item) == 3:
+            item = (item[0], item[1], int(item[2])) # int() raises a ValueError for a bad weight
+        elif len(item) != 1:
+            raise ValueError(line)
+    if not all(isinstance(name, str) for name in item[:2]) or (len(item) == 3 and (type(item[2]) is not int or item[2] < 0)):
+        raise ValueError(line) # router names must be strings and weights whole numbers that aren't negative, like the endpoint bodies
+    return item
+
+# the network each worker process searches, set once when the worker starts
+_worker_graph = None
+
+def _start_worker(graph): # initializer for the routing table and batch route workers
+    global _worker_graph
+    _worker_graph = Graph(cache_size=0, storage=graph) # every tree is only used once, so don't cache them
+
+def _routing_rows(sources, graph=None): # work out the routing table of each router in a chunk
+    graph = graph or _worker_graph
+    return [{'router': source, 'routes': graph.routes(source)} for source in sources]
+
+def _route_rows(groups, graph=None): # work out the paths for a chunk of (first router, [second routers]) groups
+    graph = graph or _worker_graph
+    return [graph._paths_from(source, targets) for source, targets in groups]
+
+def _routing_table(graph, processes, chunk_size): # yield the routing table of each router in the published network
+    sources = list(graph)
+    if processes == 1 or len(sources) <= chunk_size: # not worth starting a pool for a small network
+        local = Graph(cache_size=0, storage=graph)
+        for i in range(0, len(sources), chunk_size):
+            yield from _routing_rows(sources[i:i + chunk_size], local)
+        return
+    chunks = [sources[i:i + chunk_size] for i in range(0, len(sources), chunk_size)] # each task works out the tables of a chunk of routers
+    with ProcessPoolExecutor(max_workers=processes, initializer=_start_worker, initargs=(graph,)) as pool: # each worker gets the network once
+        for rows in pool.map(_routing_rows, chunks): # results come back in order as the chunks finish
+            yield from rows
+
 # starter code that creates the graph, nodes, and edges
-g = Graph()
+# set ROUTERS_STORAGE=csr to keep the connections in compact arrays instead of dictionaries
+g = Graph(storage=CSRStorage()) if os.environ.get('ROUTERS_STORAGE') == 'csr' else Graph()
+
+# set ROUTERS_DATA_DIR to keep the network on disk, it is loaded from the latest snapshot and log when the server starts
+if os.environ.get('ROUTERS_DATA_DIR'):
+    journal = Journal(os.environ['ROUTERS_DATA_DIR'], int(os.environ.get('ROUTERS_SNAPSHOT_EVERY', 100000)))
+    journal.restore(g)
+    g.journal = journal
+
+# counters and latency histograms for every endpoint and for the searches, shown at /metrics
+metrics = Metrics()
+metrics.counter('routers_http_requests_total', 'Requests handled, by endpoint and status code.')
+metrics.histogram('routers_http_request_duration_seconds', 'Time taken to answer a request, by endpoint.')
+metrics.counter('routers_searches_total', 'Shortest path searches, by the algorithm used.')
+metrics.counter('routers_search_settled_nodes_total', 'Routers settled by the shortest path searches.')
+metrics.counter('routers_search_relaxed_edges_total', 'Connections relaxed by the shortest path searches.')
+metrics.histogram('routers_search_duration_seconds', 'Time taken by a shortest path search, by the algorithm used.')
+metrics.counter('routers_tree_cache_hits_total', 'Shortest path trees found in the cache.')
+metrics.counter('routers_tree_cache_misses_total', 'Shortest path trees that had to be built.')
+metrics.gauge('routers_graph_routers', 'Routers in the network.', lambda: len(g._current()[1]))
+metrics.gauge('routers_graph_connections', 'Connections in the network.', lambda: sum(len(edges) for edges in g._current()[1].values()) // 2)
+metrics.gauge('routers_graph_version', 'Version of the network, increased by every change.', lambda: g.version)
+metrics.gauge('routers_tree_cache_size', 'Shortest path trees in the cache.', lambda: len(g._trees))
+g.metrics = metrics
+app.add_middleware(MetricsMiddleware, metrics=metrics)
 
 # nodes = ['A', 'B', 'C', 'D', 'E']
 # for node in nodes:
@@ -263,15 +1083,18 @@ g = Graph()
 # g.addEdge('E', 'C', 5)
 # g.addEdge('D', 'E', 1)
 #--------------------------------------------------------
+# the endpoints that change the network are plain functions, so FastAPI runs them in its thread pool and
+# waiting for the writer lock never holds up the event loop. the route endpoints only read published versions.
 @app.post("/addrouter", tags=["Add Router"], summary="Enter the name of the router you want to add.", response_description="The status of adding the router")
-async def addrouter(item : RouterItem): # addrouter endpoint takes the name of a router to add to the network
+def addrouter(item : RouterItem): # addrouter endpoint takes the name of a router to add to the network
     status = ""
 
-    if item.name in g.nodes(): # if the node (router) is already in the graph (network)
-        status = "Error, node already exists"
-    else: # if it isn't in the graph, add it
-        status = "success"
-        g.addNode(item.name)
+    with g.lock: # so another request can't add the same router between the check and the add
+        if item.name in g.graph: # if the node (router) is already in the graph (network)
+            status = "Error, node already exists"
+        else: # if it isn't in the graph, add it
+            status = "success"
+            g.addNode(item.name)
     
     return { # return the status of adding the router to the network
         "status": status
@@ -279,10 +1102,11 @@ async def addrouter(item : RouterItem): # addrouter endpoint takes the name of a
 
 # to create a connection between two routers
 @app.post("/connect", tags=["Connect Routers"], summary="Enter the name of the two routers you want to connect.", response_description="The status of connecting the routers") 
-async def connect(item : EdgeWeightItem): # end point takes two routers and the weight of the connection between them
-    status = g.check(item.from_, item.to) # find out what the return status of the endpoint will be
+def connect(item : EdgeWeightItem): # end point takes two routers and the weight of the connection between them
+    with g.lock: # so the status matches the change that is made
+        status = g.check(item.from_, item.to) # find out what the return status of the endpoint will be
 
-    g.addEdge(item.from_, item.to, item.weight) # add the connection to the network
+        g.addEdge(item.from_, item.to, item.weight) # add the connection to the network
     
     return { # return whether the connection was successful or not
         "status": status
@@ -290,21 +1114,30 @@ async def connect(item : EdgeWeightItem): # end point takes two routers and the
 
 # remove a router from the network
 @app.post("/removerouter", tags=["Remove Router"], summary="Enter the name of the router you want to remove.", response_description="The status of removing the router")
-async def removerouter(item : RouterItem): # endpoint takes the name of the router to be removed
+def removerouter(item : RouterItem): # endpoint takes the name of the router to be removed
 
-    if item.name in g.nodes(): # check if the router is actually in the network 
-        g.removeNode(item.name) # remove the router from the network
+    g.removeNode(item.name) # remove the router from the network, routers that aren't in the network are skipped
 
     return { # return if the router has been removed successfully
         "status": "success" # even if the router isn't in the network the status is still success because the user got what they want
     }
         
+# remove a batch of routers from the network
+@app.post("/removerouters", tags=["Remove Routers"], summary="Enter the names of the routers you want to remove.", response_description="The status of removing the routers")
+def removerouters(item : RoutersItem): # endpoint takes a list of routers to be removed
+    g.removeNodes(item.names) # routers that aren't in the network are skipped
+
+    return { # return if the routers have been removed successfully
+        "status": "success"
+    }
+
 # remove a connection between two routers
 @app.post("/removeconnection", tags=["Remove Connection"], summary="Enter the name of the two routers you want to remove the connection between.", response_description="The status of removing the connection")
-async def removeconnection(item : EdgeItem): # takes the two routers
+def removeconnection(item : EdgeItem): # takes the two routers
 
-    if item.from_ in g.nodes() and item.to in g.nodes(): # check that both routers are in the network
-        g.removeEdge(item.from_, item.to) # remove the connection between them
+    with g.lock: # so neither router can be removed between the check and the change
+        if item.from_ in g.graph and item.to in g.graph: # check that both routers are in the network
+            g.removeEdge(item.from_, item.to) # remove the connection between them
 
     return { # return if the connection has been removed successfully
         "status": "success" # even if the connection isn't in the network the status is still success because the user got what they want
@@ -312,29 +1145,102 @@ async def removeconnection(item : EdgeItem): # takes the two routers
 
 # find the shortest path between two routers
 @app.post("/route", tags=["Find Shortest Path"], summary="Enter the name of the two routers you want to find the path between.", response_description="The path taken between the routers")
-async def route(item : EdgeItem): # endpoint takes the two routers in question
+async def route(item : RouteItem): # endpoint takes the two routers in question, and optionally the search algorithm
+    stats = {} if item.profile else None # only ask for the timings when they will be returned
     if item.from_ == item.to: # if start and end router are the same
         full_path = []
         full_path.append(item.from_) # the path taken only contains the node
-        return {
+        response = {
             "from": item.from_,
             "to": item.to,
             "weight": 0, # the weight of the route is 0 as you haven't moved
             'route': full_path
         }
-    elif item.from_ in g.nodes() and item.to in g.nodes(): # check that both routers are in the network
-        weight, full_path = g.shortest_path(item.from_, item.to) # return the distance between the two routers and the path taken between them
+    elif item.from_ in g.graph and item.to in g.graph: # check that both routers are in the network
+        weight, full_path = g.shortest_path(item.from_, item.to, item.algorithm, stats) # return the distance between the two routers and the path taken between them
 
-        return { # return the start router, final router, the distance between them, and the path taken
+        response = { # return the start router, final router, the distance between them, and the path taken
             "from": item.from_,
             "to": item.to,
             "weight": weight,
             'route': full_path
         }
     else: # if one or both of the routers aren't in the network, return a weight of -1 and an empty list for the path taken
-        return {
+        response = {
             "from": item.from_,
             "to": item.to,
             "weight": -1,
             'route': []
-        }
\ No newline at end of file
+        }
+    if item.profile: # the timing breakdown, empty if no search was needed
+        response['profile'] = stats
+    return response
+
+# find the shortest paths between many pairs of routers in one request
+# a plain function so the searches run in the thread pool and a big batch doesn't hold up the other requests
+@app.post("/routes", tags=["Batch Routes"], summary="Enter the pairs of routers you want to find the paths between.", response_description="The path taken between each pair of routers")
+def routes(item : RoutesItem): # endpoint takes a list of pairs of routers
+    pairs = [(pair.from_, pair.to) for pair in item.routes]
+    results = g.shortest_paths(pairs) # one search for each different first router, shared by all of its pairs
+    response = []
+    for (node1, node2), (weight, full_path) in zip(pairs, results):
+        if node1 == node2: # the same answer /route gives when the start and end router are the same
+            weight, full_path = 0, [node1]
+        response.append({
+            "from": node1,
+            "to": node2,
+            "weight": weight,
+            'route': full_path
+        })
+    return response
+
+# find the equal cost next hops and the k shortest paths between two routers
+@app.post("/multipath", tags=["Multipath Routes"], summary="Enter the name of the two routers and how many paths you want.", response_description="The next hops and paths between the routers")
+def multipath(item : MultipathItem): # endpoint takes the two routers and the number of paths
+    if item.from_ == item.to: # if start and end router are the same, the only path is the router itself, like /route
+        return {
+            "from": item.from_,
+            "to": item.to,
+            "weight": 0,
+            "next_hops": [],
+            "paths": [{"weight": 0, "route": [item.from_]}]
+        }
+    weight, hops = g.ecmp(item.from_, item.to) # the neighbours that are on a shortest path
+    paths = g.k_shortest_paths(item.from_, item.to, item.k) # routers that aren't in the network have no paths
+
+    return {
+        "from": item.from_,
+        "to": item.to,
+        "weight": weight,
+        "next_hops": hops,
+        "paths": [{"weight": path_weight, "route": full_path} for path_weight, full_path in paths]
+    }
+
+MAX_IMPORT_ERRORS = 100 # failed lines listed in the /import response, so a file full of bad lines can't fill memory
+
+# add routers and connections from a topology file sent as the body of the request
+@app.post("/import", tags=["Bulk Import"], summary="Send a topology file with one router or connection per line.", response_description="The status of each line")
+async def importtopology(request : Request):
+    with tempfile.TemporaryFile() as body: # the whole file is saved before the writer lock is taken, so a slow upload can't hold it
+        async for chunk in request.stream(): # read the body a chunk at a time, a client that disconnects stops here with nothing applied
+            body.write(chunk)
+        body.seek(0)
+        counts, errors = await run_in_threadpool(g.load, body, MAX_IMPORT_ERRORS) # the whole file is applied as one version
+
+    return {
+        "status": "success",
+        "lines": sum(counts.values()),
+        "counts": counts,
+        "errors": errors
+    }
+
+# show the counters and histograms in the prometheus text format
+@app.get("/metrics", tags=["Metrics"], summary="Get the service metrics in the Prometheus text format.", response_description="The metrics", response_class=PlainTextResponse)
+async def showmetrics():
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+# return the routing table of every router in the network
+@app.post("/routingtable", tags=["Routing Tables"], summary="Get the routing table of every router in the network.", response_description="One line of JSON per router with its next hops")
+async def routingtable():
+    rows = (json.dumps(row) + '\n' for row in g.routing_table()) # stream each router's table as soon as it is ready
+    return StreamingResponse(rows, media_type='application/x-ndjson')
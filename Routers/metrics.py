@@ -0,0 +1,110 @@
+# counters, gauges and latency histograms for the routing service, shown at /metrics in the prometheus text format
+import threading
+import time
+from bisect import bisect_left
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock() # requests are handled on several threads at once
+        self._help = {} # metric name -> (type, help text)
+        self._values = {} # metric name -> {labels: value}, where labels is a tuple of (label, value) pairs
+        self._buckets = {} # histogram name -> bucket upper bounds
+        self._gauges = {} # gauge name -> function returning its current value, only called when the metrics are read
+
+    def counter(self, name, help):
+        self._help[name] = ('counter', help)
+        self._values[name] = {}
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self._help[name] = ('histogram', help)
+        self._values[name] = {}
+        self._buckets[name] = buckets
+
+    def gauge(self, name, help, function):
+        self._help[name] = ('gauge', help)
+        self._gauges[name] = function
+
+    def inc(self, name, amount=1, **labels): # add to a counter
+        key = tuple(sorted(labels.items()))
+        values = self._values[name]
+        with self._lock:
+            values[key] = values.get(key, 0) + amount
+
+    def observe(self, name, value, **labels): # add one value to a histogram
+        key = tuple(sorted(labels.items()))
+        values = self._values[name]
+        i = bisect_left(self._buckets[name], value) # the first bucket the value fits in, len(buckets) is the +Inf bucket
+        with self._lock:
+            entry = values.get(key)
+            if entry is None:
+                entry = values[key] = [[0] * (len(self._buckets[name]) + 1), 0.0, 0] # count in each bucket, sum, count
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def value(self, name, **labels): # the current value of a counter, 0 if it has never been added to
+        return self._values[name].get(tuple(sorted(labels.items())), 0)
+
+    def render(self): # every metric in the prometheus text format
+        lines = []
+        for name, (kind, help) in self._help.items():
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            if kind == 'gauge':
+                lines.append('{} {}'.format(name, _number(self._gauges[name]())))
+                continue
+            with self._lock:
+                values = [(key, value if kind == 'counter' else (list(value[0]), value[1], value[2])) for key, value in self._values[name].items()]
+            for key, value in values:
+                if kind == 'counter':
+                    lines.append('{}{} {}'.format(name, _labels(key), _number(value)))
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket in zip(self._buckets[name] + (float('inf'),), counts): # prometheus buckets count every value up to the bound
+                    cumulative += bucket
+                    lines.append('{}_bucket{} {}'.format(name, _labels(key + (('le', _number(bound)),)), cumulative))
+                lines.append('{}_sum{} {}'.format(name, _labels(key), _number(total)))
+                lines.append('{}_count{} {}'.format(name, _labels(key), count))
+        return '\n'.join(lines) + '\n'
+
+class MetricsMiddleware: # ASGI middleware that counts the requests to each endpoint and times them
+
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+        self._paths = None # the paths of the endpoints, worked out on the first request
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        if self._paths is None:
+            self._paths = {route.path for route in scope['app'].routes}
+        path = scope['path'] if scope['path'] in self._paths else 'other' # so unknown paths can't make endless labels
+        start = time.perf_counter()
+        status = [500] # the status of the response, kept as 500 if the endpoint raises
+
+        async def send_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally: # streamed responses are timed until the last line is sent
+            self.metrics.inc('routers_http_requests_total', path=path, status=str(status[0]))
+            self.metrics.observe('routers_http_request_duration_seconds', time.perf_counter() - start, path=path)
+
+def _labels(key): # {label="value",...}, or nothing if there are no labels
+    if not key:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(label, str(value).replace('\\', '\\\\').replace('"', '\\"')) for label, value in key) + '}'
+
+def _number(value): # prometheus writes infinity as +Inf
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
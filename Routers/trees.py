@@ -0,0 +1,82 @@
+# copy on write layers for the cached shortest path trees
+# a write can't repair a cached tree in place because readers may be walking it, and copying the whole tree costs O(routers)
+# for every cached tree the write touches. so a repaired tree is a layer instead: the changes made since the tree was last
+# copied, over the plain dict they change, which is never changed again. once the changes get big they are folded into a new dict
+from collections.abc import MutableMapping
+
+_REMOVED = object() # marks a router the changes have taken out of the tree
+_MISSING = object() # a router the changes don't mention
+
+class TreeLayer(MutableMapping): # a tree dict (router -> distance, or router -> previous router) with changes over a shared dict
+    __slots__ = ('_base', '_changes', '_size')
+
+    def __init__(self, base, changes=None, size=None):
+        self._base = base # plain dict shared with readers, never changed
+        self._changes = {} if changes is None else changes # router -> new value, or _REMOVED
+        self._size = len(base) if size is None else size
+
+    def __getitem__(self, node):
+        value = self._changes.get(node, _MISSING)
+        if value is _MISSING:
+            return self._base[node]
+        if value is _REMOVED:
+            raise KeyError(node)
+        return value
+
+    def get(self, node, default=None): # the same as the Mapping one, written out since the searches call it the most
+        value = self._changes.get(node, _MISSING)
+        if value is _MISSING:
+            return self._base.get(node, default)
+        return default if value is _REMOVED else value
+
+    def __contains__(self, node):
+        value = self._changes.get(node, _MISSING)
+        if value is _MISSING:
+            return node in self._base
+        return value is not _REMOVED
+
+    def __setitem__(self, node, value):
+        if node not in self:
+            self._size += 1
+        self._changes[node] = value
+
+    def __delitem__(self, node):
+        if node not in self:
+            raise KeyError(node)
+        if node in self._base:
+            self._changes[node] = _REMOVED
+        else:
+            del self._changes[node]
+        self._size -= 1
+
+    def __iter__(self):
+        changes = self._changes
+        for node in self._base:
+            if changes.get(node) is not _REMOVED:
+                yield node
+        for node, value in changes.items(): # routers the changes added
+            if node not in self._base and value is not _REMOVED:
+                yield node
+
+    def __len__(self):
+        return self._size
+
+# function to return a copy of a tree that can be changed without readers of the tree seeing it
+# the copy only holds the changes, so it costs O(changes) instead of O(routers). once there are more than a few times the
+# square root of the size of the tree they are folded into a new dict, which balances copying the changes on every write
+# against copying the whole tree every so often
+def copy_tree(tree):
+    if not isinstance(tree, TreeLayer):
+        return TreeLayer(tree)
+    if len(tree._changes) > max(64, 4 * int(len(tree) ** 0.5)):
+        return TreeLayer(_fold(tree))
+    return TreeLayer(tree._base, dict(tree._changes), tree._size)
+
+def _fold(tree): # the tree as one plain dict
+    flat = dict(tree._base)
+    for node, value in tree._changes.items():
+        if value is _REMOVED:
+            del flat[node]
+        else:
+            flat[node] = value
+    return flat
@@ -0,0 +1,70 @@
+# batching chat messages by room, so a busy room gets one packet every flush window instead of one packet per message
+# socket.io encodes each emit once and puts the same packet in every member's queue, so a batch is encoded once however many
+# members the room has. members whose queue of unsent packets grows past a limit are disconnected instead of being buffered forever
+import threading
+
+class RoomBroadcaster:
+
+    def __init__(self, socketio, window=0.02, max_batch=256, max_queue=1024, history=None):
+        self.socketio = socketio
+        self.history = history # each batch is added to the room's history as it is sent (see history.py)
+        self.window = window # seconds messages wait to be batched together
+        self.max_batch = max_batch # a room with this many messages waiting is sent straight away
+        self.max_queue = max_queue # packets a member can have waiting to be written before they are disconnected
+        self.stats = {'messages': 0, 'batches': 0, 'slow_disconnects': 0, 'errors': 0}
+        self._pending = {} # room -> messages waiting to be sent
+        self._lock = threading.Lock() # protects _pending, messages come from many handlers at once
+        self._flush_lock = threading.Lock() # one flush at a time, so batches for a room go out in order
+        self._started = False
+
+    def publish(self, room, message): # add a message to the room's next batch
+        with self._lock:
+            if not self._started: # started on the first message, once the server's async mode is running
+                self._started = True
+                self.socketio.start_background_task(self._run)
+            pending = self._pending.setdefault(room, [])
+            pending.append(message)
+            full = len(pending) >= self.max_batch
+        if full:
+            self.flush([room])
+
+    def flush(self, rooms=None): # send the waiting messages of the given rooms, or of every room
+        with self._flush_lock:
+            with self._lock:
+                if rooms is None:
+                    batches, self._pending = self._pending, {}
+                else:
+                    batches = {room: self._pending.pop(room) for room in rooms if room in self._pending}
+            for room, messages in batches.items(): # a room that fails is logged and skipped, so the other rooms still get their messages
+                try:
+                    self._drop_slow(room)
+                    self.socketio.emit('batch', messages, to=room) # one packet with every message, shared by every member
+                    self.stats['messages'] += len(messages)
+                    self.stats['batches'] += 1
+                except Exception:
+                    self._failed('sending a batch to room %r failed', room)
+                if self.history is not None: # after sending, so someone joining in between doesn't get these messages twice
+                    try:
+                        self.history.extend(room, messages)
+                    except Exception: # e.g. the disk is full, the messages were still sent
+                        self._failed('saving the history of room %r failed', room)
+
+    def _failed(self, message, *args): # count and log an error, with its traceback
+        self.stats['errors'] += 1
+        self.socketio.server.logger.exception(message, *args)
+
+    def _drop_slow(self, room): # disconnect the members of the room that can't keep up, they can reconnect and join again
+        server = self.socketio.server
+        for sid, eio_sid in list(server.manager.get_participants('/', room)):
+            connection = server.eio.sockets.get(eio_sid)
+            if connection is not None and connection.queue.qsize() > self.max_queue:
+                server.disconnect(sid)
+                self.stats['slow_disconnects'] += 1
+
+    def _run(self): # flush every window, for as long as the server runs
+        while True:
+            self.socketio.sleep(self.window)
+            try:
+                self.flush()
+            except Exception: # never stop, or every message after this would wait forever
+                self._failed('flushing the batches failed')
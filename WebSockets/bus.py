@@ -0,0 +1,112 @@
+# a message bus so several server processes can share rooms, with no outside services needed
+# each process connects to a small broker over a local socket, and the broker passes every message a process publishes on to
+# every other process, which then sends it to the users in the room that are connected to that process
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import socketio
+
+# function to turn a message into one line of JSON
+def json_line(data):
+    return (json.dumps(data) + '\n').encode()
+
+# function to turn a url like "local://127.0.0.1:5556" into a (host, port) pair
+def bus_address(url):
+    parts = urlsplit(url)
+    if parts.scheme != 'local' or not parts.port:
+        raise ValueError('expected a message queue url like local://127.0.0.1:5556, got ' + url)
+    return parts.hostname or '127.0.0.1', parts.port
+
+class LocalBusManager(socketio.PubSubManager): # client manager for flask-socketio that sends room messages through the broker below
+    name = 'local'
+
+    def __init__(self, url='local://127.0.0.1:5556', channel='socketio', write_only=False, logger=None, json=None, on_remote_emit=None):
+        self.address = bus_address(url)
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.on_remote_emit = on_remote_emit # called with (event, arguments, room) for each emit made by another process
+        self._socket = None # one connection to the broker for both publishing and listening
+        self._lock = threading.Lock() # messages are published from many handlers at once, and each line has to go out whole
+
+    def _connect(self): # connect to the broker if not connected yet, the lock must be held
+        if self._socket is None:
+            self._socket = socket.create_connection(self.address)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # messages are small and should go straight away
+            hello = {'channel': self.channel, 'listen': not self.write_only} # a write only manager is never sent anything
+            self._socket.sendall(json_line(hello))
+        return self._socket
+
+    def _publish(self, data):
+        line = (self.json.dumps(data) + '\n').encode()
+        with self._lock:
+            try:
+                self._connect().sendall(line)
+            except OSError: # the broker was restarted, try once more with a new connection
+                self._socket = None
+                self._connect().sendall(line)
+
+    def _handle_emit(self, message):
+        super()._handle_emit(message)
+        if self.on_remote_emit is not None and message.get('host_id') != self.host_id:
+            self.on_remote_emit(message['event'], message['data'], message.get('room'))
+
+    def _listen(self):
+        while True:
+            connection = None
+            try:
+                with self._lock:
+                    connection = self._connect()
+                yield from connection.makefile('rb') # one message per line, blocks until the next one arrives
+            except OSError:
+                pass
+            with self._lock: # the broker isn't there, wait and connect again
+                if connection is not None and self._socket is connection:
+                    self._socket = None
+            time.sleep(1)
+
+class Broker: # passes each line a process publishes on to every other process listening on the same channel
+
+    def __init__(self, host='127.0.0.1', port=5556):
+        self.listener = socket.create_server((host, port), backlog=128)
+        self.address = self.listener.getsockname()
+        self._lock = threading.Lock()
+        self._channels = {} # channel -> {connection: lock}, each connection has its own lock so lines from two publishers don't mix
+
+    def serve_forever(self):
+        while True:
+            connection, _ = self.listener.accept()
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection): # read the lines one process publishes and send them on
+        lines = connection.makefile('rb')
+        try:
+            hello = json.loads(lines.readline())
+            with self._lock:
+                listeners = self._channels.setdefault(hello['channel'], {})
+                if hello['listen']:
+                    listeners[connection] = threading.Lock()
+            for line in lines:
+                with self._lock:
+                    targets = [(other, lock) for other, lock in listeners.items() if other is not connection]
+                for other, lock in targets:
+                    try:
+                        with lock:
+                            other.sendall(line)
+                    except OSError: # that process has gone, its own thread will remove it
+                        pass
+        except (OSError, ValueError, KeyError):
+            pass
+        finally:
+            with self._lock:
+                for listeners in self._channels.values():
+                    listeners.pop(connection, None)
+            connection.close()
+
+# function to start a broker in a background thread, returns the broker
+def start_broker(url):
+    broker = Broker(*bus_address(url))
+    threading.Thread(target=broker.serve_forever, daemon=True).start()
+    return broker
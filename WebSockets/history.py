@@ -0,0 +1,96 @@
+# the recent messages of each room, so someone joining a room can see what was said before they came in
+# each room keeps its last messages in a ring buffer of fixed size, and can also append every message to a file for that room,
+# so the history is still there after a restart. only the end of the file is ever read, so a room with millions of old messages
+# loads as fast as a new one
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+
+class RoomHistory:
+
+    def __init__(self, size=100, directory=None, max_files=64):
+        self.size = size # messages kept for each room
+        self.directory = directory # where the files of each room go, None keeps the history in memory only
+        self.max_files = max_files # files kept open at once, there can be far more rooms than the process can have files open
+        self._rooms = {} # room -> deque of its last messages, oldest first
+        self._files = OrderedDict() # room -> its file, open for appending, least recently used first
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def add(self, room, message, save=True): # remember a message, save=False for messages another process has already saved
+        self.extend(room, [message], save)
+
+    def extend(self, room, messages, save=True):
+        with self._lock:
+            self._room(room).extend(messages) # the deque drops the oldest messages once it is full
+            if save and self.directory:
+                file = self._file(room)
+                file.write(b''.join(json.dumps(message).encode() + b'\n' for message in messages)) # one write, appended whole
+
+    def recent(self, room, count=None): # the last count messages of the room (all that are kept if count is None), oldest first
+        with self._lock:
+            messages = self._room(room)
+            if count is None or count >= len(messages):
+                return list(messages)
+            return list(islice(reversed(messages), count))[::-1] # only walks the count messages wanted
+
+    def forget(self, room): # drop a room that has been removed, its file stays on disk and is read again if the room comes back
+        with self._lock:
+            self._rooms.pop(room, None)
+            file = self._files.pop(room, None)
+            if file is not None:
+                file.close()
+
+    def _file(self, room): # the open file of a room, closing the least recently used file once too many are open
+        file = self._files.get(room)
+        if file is not None:
+            self._files.move_to_end(room)
+            return file
+        file = self._files[room] = open(self._path(room), 'ab', buffering=0)
+        if file.tell() > 0 and not _ends_with_newline(self._path(room)): # finish a line cut off by a crash
+            file.write(b'\n')
+        while len(self._files) > self.max_files:
+            self._files.popitem(last=False)[1].close()
+        return file
+
+    def _room(self, room): # the ring buffer of a room, filled from the end of its file the first time the room is used
+        messages = self._rooms.get(room)
+        if messages is None:
+            messages = self._rooms[room] = deque(maxlen=self.size)
+            if self.directory and os.path.exists(self._path(room)):
+                messages.extend(tail(self._path(room), self.size))
+        return messages
+
+    def _path(self, room): # room names can hold any character, so the file is named by the hex of the name
+        return os.path.join(self.directory, room.encode().hex() + '.log')
+
+# function to read the last count messages of a file of one JSON message per line, reading backwards from the end in blocks
+def tail(path, count, block=65536):
+    if count <= 0:
+        return []
+    with open(path, 'rb') as file:
+        end = file.seek(0, os.SEEK_END)
+        data = b''
+        while end > 0 and data.count(b'\n') <= count: # one line more than needed, as the first line read may be cut off
+            start = max(0, end - block)
+            file.seek(start)
+            data = file.read(end - start) + data
+            end = start
+    lines = data.split(b'\n')
+    if end > 0: # didn't reach the start of the file, so the first line is only part of a line
+        lines = lines[1:]
+    messages = []
+    for line in lines[-count - 1:]:
+        try:
+            messages.append(json.loads(line))
+        except ValueError: # a blank line, or a line cut off by a crash while it was being written
+            pass
+    return messages[-count:]
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b'\n'
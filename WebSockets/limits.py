@@ -0,0 +1,65 @@
+# rate limits for the chat server, so one user sending too fast can't slow down a room for everyone else
+# each connection and each room has a token bucket: it holds up to burst tokens, refills at rate tokens a second, and every event
+# takes one token. the bucket is only refilled when it is used, from the time since it was last used, so a check is O(1)
+# a room's bucket is shared by everyone in it, so it also counts the drops in a row of each sender, and each of them is told
+import threading
+import time
+from collections import OrderedDict
+
+class TokenBucket:
+    __slots__ = ('tokens', 'stamp', 'drops', 'senders') # lots of these, one for each connection and room
+
+    def __init__(self, tokens, stamp):
+        self.tokens = tokens
+        self.stamp = stamp # when it was last refilled
+        self.drops = 0 # events dropped in a row since the last one allowed
+        self.senders = None # sender -> their events dropped in a row since one of theirs was allowed, only while some are dropped
+
+class RateLimiter:
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate # tokens added each second
+        self.burst = burst # the most tokens a bucket holds, so the most events allowed at once
+        self.max_keys = max_keys # buckets kept, the least recently used is dropped, it would be full again by now anyway
+        self.stats = {'allowed': 0, 'dropped': 0}
+        self._buckets = OrderedDict() # key -> its bucket, least recently used first
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None, sender=None): # take a token for an event, returns 0 if it is allowed, or how many events in a row have been dropped
+        # with a sender, the drops in a row are that sender's own, not everyone's who shares the bucket
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.burst, now)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.stamp) * self.rate)
+                bucket.stamp = now
+                if bucket.senders and bucket.tokens >= self.burst: # full again, so nobody is being dropped any more
+                    bucket.senders = None
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                bucket.drops = 0
+                if bucket.senders:
+                    bucket.senders.pop(sender, None)
+                self.stats['allowed'] += 1
+                return 0
+            bucket.drops += 1
+            self.stats['dropped'] += 1
+            if sender is None:
+                return bucket.drops
+            if bucket.senders is None:
+                bucket.senders = {}
+            drops = bucket.senders[sender] = bucket.senders.get(sender, 0) + 1
+            return drops
+
+    def forget(self, key): # drop the bucket of a connection that has gone
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def counters(self): # the stats, with the settings and the number of buckets, for tuning the limits
+        with self._lock:
+            return dict(self.stats, rate=self.rate, burst=self.burst, buckets=len(self._buckets))
@@ -0,0 +1,173 @@
+# load test for the chat server, run with: python loadtest.py --workers 1 2 4 --clients 200 --rooms 10 --rate 200
+# compare batching against sending each message on its own with: python loadtest.py --workers 1 --flush-window 0 20 --rooms 1 --room-rate 0
+# try the rate limits with: python loadtest.py --workers 1 --clients 20 --rate 400 --message-rate 5
+# for each number of workers it starts the server, connects the clients to random rooms, sends messages at a steady rate for a while,
+# and reports how many connections were held, how many messages were sent and delivered per second, and how long delivery took
+import argparse
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from simple_websocket import Client, ConnectionClosed
+
+HERE = Path(__file__).resolve().parent
+
+# function to start the server with a number of workers, returns the process
+def start_server(workers, port, bus_port, async_mode=None, flush_window=20, message_rate=None, room_rate=None):
+    command = [sys.executable, str(HERE / 'main.py'), '--port', str(port), '--workers', str(workers), '--flush-window', str(flush_window)]
+    if message_rate is not None: # otherwise the server's default limits
+        command += ['--message-rate', str(message_rate)]
+    if room_rate is not None:
+        command += ['--room-rate', str(room_rate)]
+    if workers > 1: # a single worker doesn't need the message queue
+        command += ['--message-queue', 'local://127.0.0.1:{}'.format(bus_port)]
+    if async_mode:
+        command += ['--async-mode', async_mode]
+    server = subprocess.Popen(command, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 20
+    while time.time() < deadline: # wait until the port accepts connections
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('the server did not start')
+
+class ChatClient: # one user, speaking the socket.io protocol over a plain websocket like the browser does
+
+    def __init__(self, url, username, room, latencies):
+        self.username, self.room = username, room
+        self.latencies = latencies # shared list of delivery times in seconds, appended to by every client
+        self.received = 0
+        self.notices = 0 # times the server said messages were dropped for being sent too fast
+        self.socket = Client.connect(url)
+        self.socket.receive(timeout=10) # the engine.io open packet
+        self.socket.send('40') # connect to the default namespace
+        self.socket.receive(timeout=10)
+        self.emit('join', {'username': username, 'room': room})
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def emit(self, event, data):
+        self.socket.send('42' + json.dumps([event, data]))
+
+    def send_message(self): # the time it was sent goes in the message, so the clients that get it can work out the delay
+        self.emit('message', {'username': self.username, 'msg': repr(time.perf_counter()), 'room': self.room})
+
+    def _read(self):
+        try:
+            while True:
+                packet = self.socket.receive()
+                if packet == '2': # the server checks the connection is still there
+                    self.socket.send('3')
+                elif packet.startswith('42'):
+                    event, data = json.loads(packet[2:])
+                    if event == 'history': # the messages sent before this user joined, not part of the test
+                        continue
+                    if event == 'notice':
+                        self.notices += 1
+                        continue
+                    now = time.perf_counter()
+                    for message in (data if event == 'batch' else [data]): # a batch holds several chat messages
+                        if message.get('username'): # a chat message, not a joined or left notice
+                            self.received += 1
+                            self.latencies.append(now - float(message['msg']))
+        except (ConnectionClosed, OSError, ValueError):
+            pass
+
+    def connected(self):
+        return self.socket.connected
+
+    def close(self):
+        self.socket.close()
+
+# function to return the value below which the given percent of the sorted values fall (nearest rank)
+def percentile(values, percent):
+    return values[max(0, -(-len(values) * percent // 100) - 1)] if values else None
+
+# function to run the test against a server with a number of workers and a flush window, returns the results
+def run(workers, flush_window, args):
+    server = start_server(workers, args.port, args.bus_port, args.async_mode, flush_window, args.message_rate, args.room_rate)
+    clients, latencies = [], []
+    try:
+        rand = random.Random(args.seed)
+        url = 'ws://127.0.0.1:{}/socket.io/?EIO=4&transport=websocket'.format(args.port)
+        start = time.perf_counter()
+        for i in range(args.clients):
+            clients.append(ChatClient(url, 'user' + str(i), 'room' + str(rand.randrange(args.rooms)), latencies))
+        connect_s = time.perf_counter() - start
+        time.sleep(1) # let the joins reach every worker
+
+        latencies.clear()
+        sent = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.duration: # send at a steady rate, from random users
+            rand.choice(clients).send_message()
+            sent += 1
+            time.sleep(max(0.0, start + sent / args.rate - time.perf_counter()))
+        send_s = time.perf_counter() - start
+        time.sleep(args.drain) # wait for the last messages to arrive
+        delivered = sum(client.received for client in clients)
+        held = sum(client.connected() for client in clients)
+        notices = sum(client.notices for client in clients)
+    finally:
+        for client in clients:
+            client.close()
+        server.terminate()
+        server.wait()
+    latencies.sort()
+    return {
+        'workers': workers,
+        'flush_window_ms': flush_window,
+        'connections_held': held,
+        'connect_seconds': connect_s,
+        'messages_sent': sent,
+        'sent_per_second': sent / send_s,
+        'messages_delivered': delivered,
+        'limit_notices': notices,
+        'delivered_per_second': delivered / (send_s + args.drain),
+        'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the chat server with different numbers of workers.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='numbers of server processes to try')
+    parser.add_argument('--clients', type=int, default=200, help='users connected at once')
+    parser.add_argument('--rooms', type=int, default=10, help='rooms the users are spread over')
+    parser.add_argument('--rate', type=float, default=200, help='messages sent per second')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to send messages for')
+    parser.add_argument('--drain', type=float, default=2, help='seconds to wait for the last messages after sending stops')
+    parser.add_argument('--flush-window', type=float, nargs='+', default=[20], help='milliseconds the server batches messages for, 0 sends each one on its own')
+    parser.add_argument('--message-rate', type=float, help="chat messages a second each user can send, 0 for no limit (default the server's)")
+    parser.add_argument('--room-rate', type=float, help="chat messages a second each room can take, 0 for no limit (default the server's)")
+    parser.add_argument('--async-mode', choices=['threading', 'eventlet', 'gevent'])
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--bus-port', type=int, default=5556)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='save the results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    print('{:>7}  {:>9}  {:>6}  {:>10}  {:>12}  {:>10}  {:>10}  {:>7}'.format('workers', 'window ms', 'held', 'sent/s', 'delivered/s', 'p50 ms', 'p99 ms',
+                                                                      'notices'))
+    for workers in args.workers:
+        for flush_window in args.flush_window:
+            result = run(workers, flush_window, args)
+            results.append(result)
+            print('{:>7}  {:>9g}  {:>6}  {:>10.1f}  {:>12.1f}  {:>10.2f}  {:>10.2f}  {:>7}'.format(
+                workers, flush_window, result['connections_held'], result['sent_per_second'], result['delivered_per_second'],
+                result['p50_ms'] or 0, result['p99_ms'] or 0, result['limit_notices']))
+    if args.output:
+        config = {key: value for key, value in vars(args).items() if key != 'output'}
+        Path(args.output).write_text(json.dumps({'config': config, 'results': results}, indent=2) + '\n')
+        print('results saved to', args.output)
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,195 @@
-from flask import Flask, render_template
+import argparse
+import os
+
+from flask import Flask, jsonify, render_template, request
 from flask_socketio import SocketIO, emit, send, join_room, leave_room
 
+from broadcast import RoomBroadcaster
+from bus import LocalBusManager
+from history import RoomHistory
+from limits import RateLimiter
+from rooms import MAX_NAME, RoomRegistry, room_name
+import workers
+
 app = Flask(__name__) # create the flask app
 app.config['SECRET_KEY'] = 'secret'
-socketio = SocketIO(app, cors_allowed_origins='*')
-ROOMS = ['main', 'help', 'fun', 'study']
+socketio = SocketIO() # set up by setup() below, so each worker process can connect to the message queue itself
+STARTING_ROOMS = ['main', 'help', 'fun', 'study'] # never removed
+rooms = None # every room, made by setup() (see rooms.py)
+broadcaster = None # batches chat messages by room when there is a flush window (see broadcast.py)
+history = None # the last messages of each room, sent to users when they join (see history.py)
+message_limit = None # chat messages each connection can send (see limits.py), None for no limit
+room_limit = None # chat messages each room can take, from all its users together
+join_limit = None # joins, leaves and new rooms each connection can ask for
 
 @app.route('/')
 def index():
-    return render_template('index.html', rooms=ROOMS) # return the html page for the chatroom
+    return render_template('index.html') # return the html page for the chatroom, it asks for the rooms a page at a time once connected
 
+@app.route('/limits')
+def limits(): # the counters of the rate limits in this worker, for tuning them under load
+    counters = {name: limiter.counters() for name, limiter in
+                [('message', message_limit), ('room', room_limit), ('join', join_limit)] if limiter is not None}
+    if broadcaster is not None:
+        counters['broadcast'] = broadcaster.stats
+    return jsonify(pid=os.getpid(), **counters) # each worker has its own counters
 
 @socketio.on('message') # event handler for sending a message
 def message(data):
+    if data['room'] not in rooms: # only rooms in the registry keep a history, so a made up name can't grow it
+        return
+    if limited(message_limit, request.sid, 'You are sending messages too fast, some were not sent.', 'message') or \
+            limited(room_limit, data['room'], 'The ' + data['room'] + ' room is busy, some messages were not sent.', 'message', request.sid):
+        return
+    rooms.touch(data['room']) # the room is in use, so it isn't removed
+    if broadcaster is not None: # sent to the room with the other messages of this flush window as one 'batch' event
+        broadcaster.publish(data['room'], {'username' : data['username'], 'msg': data['msg']})
+        return
+    if history is not None:
+        history.add(data['room'], {'username' : data['username'], 'msg': data['msg']})
     send({'username' : data['username'], 'msg': data['msg']}, room=data['room'], broadcast=True)
     # the username and message will be broadcasted to everyone in the same room as the user
 
 @socketio.on('newroom') # event handler for creating a new room
 def newroom(data):
-    ROOMS.append(data['new']) # take the name of the new room and append it to the list of rooms
+    if limited(join_limit, request.sid, 'You are making rooms too fast, wait a moment.', 'newroom'):
+        return
+    name = room_name(data['new'])
+    if name is not None and rooms.add(name): # a room that is already there isn't added again
+        socketio.emit('newroom', {'name': name, 'members': 0}) # tell everyone, so their lists get the new room
+    evict()
+
+@socketio.on('rooms') # event handler for getting the list of rooms, a page at a time
+def room_list(data):
+    data = data if isinstance(data, dict) else {}
+    after, limit = data.get('after'), data.get('limit', 50) # the rooms after the last one the user has
+    if (after is not None and not isinstance(after, str)) or not isinstance(limit, int) or isinstance(limit, bool):
+        emit('notice', {'msg': 'The room list was asked for with a wrong after or limit.', 'event': 'rooms'})
+        return
+    evict() # so rooms that are about to go aren't listed
+    page, after = rooms.page(after, limit)
+    emit('rooms', {'rooms': [{'name': name, 'members': members} for name, members in page], 'next': after, 'total': len(rooms)})
 
 @socketio.on('join') # event handler for joining a new room
 def join(data):
+    if limited(join_limit, request.sid, 'You are changing rooms too fast, wait a moment and join again.', 'join'):
+        return
+    if room_name(data['room']) != data['room']: # the same check as a new room, as joining a room that isn't there makes it
+        emit('notice', {'msg': "That room name can't be used, names are 1 to {} characters.".format(MAX_NAME), 'event': 'join'})
+        return
     join_room(data['room']) # join the room
+    if rooms.join(data['room'], request.sid): # joining a room that isn't there makes it
+        socketio.emit('newroom', {'name': data['room'], 'members': 1})
+    if history is not None: # send the user what was said before they joined, all in one event
+        emit('history', history.recent(data['room']))
     send({'msg': data['username'] + ' has joined the ' + data['room']
     + ' room.'}, room=data['room']) # send a message to everyone in the room that the user has joined
 
 @socketio.on('leave') # event handler for leaving a room
 def leave(data):
     leave_room(data['room']) # leave the room
+    rooms.leave(data['room'], request.sid)
+    if limited(join_limit, request.sid): # leaving always works, only the notice to the room is dropped
+        return
     send({'msg': data['username'] + ' has left the ' + data['room']
     + ' room.'}, room=data['room']) # send out a message to everyone still in the room that the user has left
 
+@socketio.on('disconnect') # event handler for a user closing the page, they leave every room they were in
+def disconnect():
+    rooms.disconnect(request.sid)
+    for limiter in (message_limit, join_limit):
+        if limiter is not None:
+            limiter.forget(request.sid)
+
+# function to check an event against a rate limit, returns True if it should be dropped
+# the user is told once, on the first event dropped in a row, so the notices can't be a flood of their own
+# a limit shared by many users, like a room's, is given the sender, so each of them is told about their own first dropped event
+def limited(limiter, key, notice=None, event=None, sender=None):
+    if limiter is None:
+        return False
+    drops = limiter.take(key, sender=sender)
+    if drops == 1 and notice:
+        emit('notice', {'msg': notice, 'event': event})
+    return drops > 0
+
+# function to make a rate limit of rate events a second, with bursts of up to twice that (at least 10), None if rate is 0
+def rate_limit(rate):
+    return RateLimiter(rate, max(2 * rate, 10)) if rate else None
+
+# function to remove the rooms that have been empty for too long, and tell everyone they are gone
+def evict():
+    for name in rooms.evict_idle():
+        forget(name)
+        socketio.emit('closeroom', {'name': name})
+
+# function to drop what is kept in memory for a room that has been removed
+def forget(name):
+    if history is not None:
+        history.forget(name)
+
+# function to set up the socket server, with a message queue so several server processes can share rooms
+# message_queue can be local://host:port for the broker in bus.py, or a redis://, amqp://, kafka:// or zmq+tcp:// url
+# async_mode is 'threading', 'eventlet' or 'gevent', by default eventlet or gevent if one is installed
+# chat messages are batched for flush_window seconds, 0 sends each message on its own
+# each room keeps its last history_size messages (0 for none), also saved to files in history_dir if it is given
+# rooms with nobody in them and no messages for room_idle seconds are removed, 0 keeps them forever
+# each connection can send message_rate chat messages and join_rate joins, leaves or new rooms a second,
+# each room takes room_rate chat messages a second, 0 turns a limit off
+def setup(message_queue=None, async_mode=None, flush_window=0.02, history_size=100, history_dir=None, room_idle=3600,
+          message_rate=5, room_rate=200, join_rate=2):
+    global rooms, broadcaster, history, message_limit, room_limit, join_limit
+    rooms = RoomRegistry(STARTING_ROOMS, room_idle or None) # made here rather than on import, so its lock is made after any green thread patch
+    message_limit, room_limit, join_limit = rate_limit(message_rate), rate_limit(room_rate), rate_limit(join_rate)
+    history = RoomHistory(history_size, history_dir) if history_size > 0 else None
+    options = {'cors_allowed_origins': '*', 'async_mode': async_mode}
+    if message_queue and message_queue.startswith('local://'): # messages and rooms from other workers go in this worker's history and rooms too
+        options['client_manager'] = LocalBusManager(message_queue, channel='flask-socketio', on_remote_emit=remote_emit)
+    elif message_queue:
+        options['message_queue'] = message_queue # flask-socketio has its own managers for these
+    socketio.init_app(app, **options)
+    if flush_window:
+        broadcaster = RoomBroadcaster(socketio, flush_window, history=history)
+    return socketio
+
+# function to follow what another worker sent, so this worker's rooms and history match
+# the other worker has already saved its chat messages to the history file
+def remote_emit(event, arguments, room):
+    if event == 'newroom':
+        rooms.add(arguments[0]['name'])
+    elif event == 'closeroom':
+        if rooms.remove(arguments[0]['name']): # kept if someone on this worker is still in it
+            forget(arguments[0]['name'])
+    if room is not None:
+        rooms.touch(room)
+    if history is None or room is None:
+        return
+    if event == 'batch':
+        history.extend(room, arguments[0], save=False)
+    elif event == 'message' and arguments[0].get('username'): # a message sent on its own, not a joined or left notice
+        history.add(room, arguments[0], save=False)
+
 if __name__ == '__main__':
-    socketio.run(app, debug=True) # run the app
+    parser = argparse.ArgumentParser(description='Run the chat server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, help='run this many server processes sharing the port, instead of the debug server')
+    parser.add_argument('--message-queue', help='url of the message queue the workers share rooms through (default local://127.0.0.1:5556 with more than one worker)')
+    parser.add_argument('--async-mode', choices=['threading', 'eventlet', 'gevent'])
+    parser.add_argument('--flush-window', type=float, default=20, help='milliseconds chat messages are batched for, 0 sends each one straight away')
+    parser.add_argument('--history', type=int, default=100, help='messages each room keeps to show users when they join')
+    parser.add_argument('--history-dir', help='folder to also save every message to, so the history is kept after a restart')
+    parser.add_argument('--room-idle', type=float, default=3600, help='seconds an empty room is kept for, 0 keeps every room')
+    parser.add_argument('--message-rate', type=float, default=5, help='chat messages a second each user can send, 0 for no limit')
+    parser.add_argument('--room-rate', type=float, default=200, help='chat messages a second each room can take, 0 for no limit')
+    parser.add_argument('--join-rate', type=float, default=2, help='joins, leaves and new rooms a second each user can ask for, 0 for no limit')
+    args = parser.parse_args()
+
+    if args.workers is None:
+        async_mode = workers.patch(args.async_mode) # before setup(), which makes the locks and sockets
+        setup(args.message_queue, async_mode, args.flush_window / 1000, args.history, args.history_dir, args.room_idle,
+              args.message_rate, args.room_rate, args.join_rate)
+        socketio.run(app, host=args.host, port=args.port, debug=True) # run the app
+    else:
+        message_queue = args.message_queue or ('local://127.0.0.1:5556' if args.workers > 1 else None)
+        workers.run(setup, app, args.host, args.port, args.workers, message_queue, args.async_mode, args.flush_window / 1000,
+                    args.history, args.history_dir, args.room_idle, args.message_rate, args.room_rate, args.join_rate)
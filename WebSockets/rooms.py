@@ -0,0 +1,123 @@
+# the rooms of the chat server, who is in each of them, and which ones nobody has used for a while
+# rooms are looked up by name in a dictionary and also kept in a sorted list, so the room list can be sent a page at a time
+import threading
+import time
+from bisect import bisect_right, insort
+from collections import OrderedDict
+
+MAX_NAME = 64 # the longest room name allowed
+MAX_PAGE = 500 # the most rooms sent in one page
+
+class RoomRegistry:
+
+    def __init__(self, permanent=(), max_idle=3600):
+        self.max_idle = max_idle # seconds an empty room is kept for, None keeps every room
+        self._permanent = set(permanent) # rooms that are never removed
+        self._members = {} # room -> set of the users (sids) in it
+        self._joined = {} # sid -> set of the rooms that user is in
+        self._names = [] # every room name, sorted, for paging
+        self._idle = OrderedDict() # empty rooms that can be removed -> when they were last used, least recently used first
+        self._lock = threading.Lock()
+        for name in permanent:
+            self.add(name)
+
+    def __contains__(self, name):
+        return name in self._members
+
+    def __len__(self):
+        return len(self._members)
+
+    def add(self, name, now=None): # add a room, returns False if it is already there
+        with self._lock:
+            made = self._add(name)
+            if made and name not in self._permanent:
+                self._idle[name] = time.time() if now is None else now # nobody is in it yet
+            return made
+
+    def _add(self, name): # the lock must be held, the room isn't marked idle
+        if name in self._members:
+            return False
+        self._members[name] = set()
+        insort(self._names, name)
+        return True
+
+    def remove(self, name): # remove a room that nobody is in, returns False if it can't be removed
+        with self._lock:
+            if name in self._permanent or self._members.get(name):
+                return False
+            return self._remove(name)
+
+    def _remove(self, name): # the lock must be held
+        if self._members.pop(name, None) is None:
+            return False
+        del self._names[bisect_right(self._names, name) - 1]
+        self._idle.pop(name, None)
+        return True
+
+    def join(self, name, sid): # add a user to a room, the room is made if it isn't there, returns True if it was made
+        with self._lock: # made and joined at once, so evict_idle can't remove the room in between
+            made = self._add(name)
+            self._members[name].add(sid)
+            self._joined.setdefault(sid, set()).add(name)
+            self._idle.pop(name, None) # a room with someone in it is never removed
+        return made
+
+    def leave(self, name, sid):
+        with self._lock:
+            self._leave(name, sid)
+            rooms = self._joined.get(sid)
+            if rooms is not None:
+                rooms.discard(name)
+                if not rooms:
+                    del self._joined[sid]
+
+    def disconnect(self, sid): # take a user out of every room they were in
+        with self._lock:
+            for name in self._joined.pop(sid, ()):
+                self._leave(name, sid)
+
+    def _leave(self, name, sid): # the lock must be held
+        members = self._members.get(name)
+        if members is None or sid not in members:
+            return
+        members.discard(sid)
+        if not members and name not in self._permanent:
+            self._idle[name] = time.time() # empty, so it starts counting towards being removed
+
+    def touch(self, name, now=None): # a message was sent in the room, so it isn't idle
+        with self._lock:
+            if name in self._idle:
+                self._idle[name] = time.time() if now is None else now
+                self._idle.move_to_end(name)
+
+    def members(self, name): # the number of users in a room
+        return len(self._members.get(name, ()))
+
+    def page(self, after=None, limit=50): # the rooms after the name given, as (name, members) pairs, and the name to ask for the next page after
+        limit = max(1, min(limit, MAX_PAGE))
+        with self._lock:
+            start = bisect_right(self._names, after) if after is not None else 0
+            names = self._names[start:start + limit]
+            more = start + limit < len(self._names)
+            return [(name, len(self._members[name])) for name in names], (names[-1] if more else None)
+
+    def evict_idle(self, now=None): # remove the empty rooms nobody has used for max_idle seconds, returns their names
+        if self.max_idle is None:
+            return []
+        cutoff = (time.time() if now is None else now) - self.max_idle
+        removed = []
+        with self._lock:
+            while self._idle:
+                name, used = next(iter(self._idle.items())) # the least recently used empty room
+                if used > cutoff:
+                    break
+                self._remove(name)
+                removed.append(name)
+        return removed
+
+# function to check a room name from a user, returns the name without spaces at the ends, or None if it can't be used
+def room_name(name):
+    if not isinstance(name, str):
+        return None
+    name = name.strip()
+    return name if 0 < len(name) <= MAX_NAME else None
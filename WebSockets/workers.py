@@ -0,0 +1,76 @@
+# running the chat server as several processes on one port, so it can use more than one core
+# every worker opens its own listening socket on the same port (SO_REUSEPORT) and the kernel hands each new connection to one of them,
+# the workers share rooms through the message queue (see bus.py)
+import importlib.util
+import multiprocessing
+import signal
+import socket
+import sys
+
+from bus import start_broker
+
+# function to make a listening socket that shares its port with the other workers
+def reuse_port_socket(host, port):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    listener.bind((host, port))
+    listener.listen(1024)
+    return listener
+
+# function to pick the async mode the way flask-socketio does when none is given, and patch the standard library for it
+# green threads only work if the patch runs before any lock or socket is made, so each worker calls this before setup()
+def patch(async_mode=None):
+    if async_mode is None:
+        async_mode = 'threading'
+        for mode in ('eventlet', 'gevent'):
+            if importlib.util.find_spec(mode) is not None:
+                async_mode = mode
+                break
+    if async_mode == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    elif async_mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    return async_mode
+
+# function to serve the app in this process until it is stopped, with the web server that suits the async mode
+def serve(socketio, app, host, port):
+    if socketio.async_mode == 'eventlet': # green threads, thousands of connections per process
+        import eventlet
+        import eventlet.wsgi
+        eventlet.wsgi.server(eventlet.listen((host, port), reuse_port=True), app, log_output=False)
+    elif socketio.async_mode == 'gevent':
+        from gevent import pywsgi
+        listener = reuse_port_socket(host, port) # a gevent socket, patch() has already swapped the socket module
+        pywsgi.WSGIServer(listener, app, log=None).serve_forever()
+    else: # a thread for each connection, works with only flask-socketio and simple-websocket installed
+        from werkzeug.serving import make_server
+        listener = reuse_port_socket(host, port) # kept open here, werkzeug works on a copy of it
+        make_server(host, port, app, threaded=True, fd=listener.fileno()).serve_forever()
+
+def _worker(setup, app, host, port, message_queue, async_mode, *options):
+    async_mode = patch(async_mode) # first, so the locks and sockets setup() makes are green ones
+    socketio = setup(message_queue, async_mode, *options) # each worker connects to the message queue itself
+    serve(socketio, app, host, port)
+
+# function to start the workers and wait for them, a local message queue's broker runs in this process
+def run(setup, app, host, port, workers, message_queue=None, async_mode=None, flush_window=0.02, history_size=100, history_dir=None,
+        room_idle=3600, message_rate=5, room_rate=200, join_rate=2):
+    if message_queue and message_queue.startswith('local://'):
+        start_broker(message_queue)
+    options = (message_queue, async_mode, flush_window, history_size, history_dir, room_idle, message_rate, room_rate, join_rate)
+    processes = [multiprocessing.Process(target=_worker, args=(setup, app, host, port) + options, daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    print('serving on http://{}:{} with {} workers'.format(host, port, workers), flush=True)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0)) # so being terminated still stops the workers below
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally: # a worker left running would keep taking connections on the port
+        for process in processes:
+            process.terminate()
@@ -0,0 +1,174 @@
+# load test for the IP calculator and routers apps, run with: python loadtest.py --requests 2000 --concurrency 8 --output results.json
+# the apps are driven in the same process through an ASGI client, so no server has to be started and the network isn't measured
+# save a run with --output and pass it to a later run with --compare to see how the latency and throughput have changed
+import argparse
+import asyncio
+import importlib.util
+import json
+import math
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent
+
+# function to import the main.py of one of the apps, each app imports its other modules from its own folder
+def load_app(folder):
+    sys.path.insert(0, str(ROOT / folder))
+    spec = importlib.util.spec_from_file_location(folder.lower() + '_main', ROOT / folder / 'main.py') # both apps are called main
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# function to make a random dotted quad
+def random_address(rand):
+    return '{}.{}.{}.{}'.format(rand.randrange(256), rand.randrange(256), rand.randrange(256), rand.randrange(256))
+
+# function to make a subnet mask with a random number of network bits
+def random_mask(rand):
+    bits = rand.randint(1, 31)
+    value = (0xFFFFFFFF << (32 - bits)) & 0xFFFFFFFF
+    return '{}.{}.{}.{}'.format(value >> 24, (value >> 16) & 255, (value >> 8) & 255, value & 255)
+
+# the requests of each workload, as (path, body) pairs, made forever from a seed so every run sends the same requests
+def ipcalc_requests(rand, args):
+    while True:
+        yield '/ipcalc', {'address': random_address(rand)}
+
+def subnet_requests(rand, args):
+    while True:
+        yield '/subnet', {'address': random_address(rand), 'mask': random_mask(rand)}
+
+def supernet_requests(rand, args):
+    while True:
+        yield '/supernet', {'addresses': [random_address(rand) for _ in range(args.supernet_size)]}
+
+def route_requests(rand, args):
+    while True:
+        yield '/route', {'from': 'R' + str(rand.randrange(args.routers)), 'to': 'R' + str(rand.randrange(args.routers))}
+
+def mutate_requests(rand, args): # add a router, link it in, change a link, then remove the router again, so the network stays the same size
+    for i in range(sys.maxsize):
+        name, other = 'X' + str(i), 'R' + str(rand.randrange(args.routers))
+        yield '/addrouter', {'name': name}
+        yield '/connect', {'from': name, 'to': other, 'weight': rand.randint(1, 100)}
+        yield '/connect', {'from': other, 'to': 'R' + str(rand.randrange(args.routers)), 'weight': rand.randint(1, 100)}
+        yield '/removerouter', {'name': name}
+
+# which app each workload sends its requests to
+WORKLOADS = {
+    'ipcalc': ('IPCalculator', ipcalc_requests),
+    'subnet': ('IPCalculator', subnet_requests),
+    'supernet': ('IPCalculator', supernet_requests),
+    'route': ('Routers', route_requests),
+    'mutate': ('Routers', mutate_requests),
+}
+
+# function to give the routers app a random sparse network, sent as one /import like a real topology file
+async def build_network(client, num_routers, degree, seed):
+    rand = random.Random(seed)
+    lines = ['R' + str(i) for i in range(num_routers)]
+    for i in range(1, num_routers): # join each router to an earlier one so the network is connected
+        lines.append('R{} R{} {}'.format(i, rand.randrange(i), rand.randint(1, 100)))
+    for _ in range(num_routers * (degree - 2) // 2): # then add random extra links until the average degree is reached
+        lines.append('R{} R{} {}'.format(rand.randrange(num_routers), rand.randrange(num_routers), rand.randint(1, 100)))
+    response = await client.post('/import', content='\n'.join(lines).encode())
+    response.raise_for_status()
+
+# function to return the value below which the given percent of the sorted values fall (nearest rank)
+def percentile(values, percent):
+    return values[max(0, math.ceil(len(values) * percent / 100) - 1)]
+
+# function to send the requests of one workload with a number of clients at once, returns the latency of each request and the total time
+async def run_workload(client, requests, count, concurrency):
+    latencies, errors, sent = [], [0], [0]
+
+    async def worker():
+        for path, body in requests: # the clients share one generator, so each request is sent once
+            if sent[0] >= count:
+                return
+            sent[0] += 1
+            start = time.perf_counter()
+            response = await client.post(path, json=body)
+            if response.status_code >= 400:
+                errors[0] += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors[0], time.perf_counter() - start
+
+async def run(args):
+    apps = {folder: load_app(folder) for folder in sorted({WORKLOADS[name][0] for name in args.workloads})}
+    clients = {folder: httpx.AsyncClient(transport=httpx.ASGITransport(app=module.app), base_url='http://test') for folder, module in apps.items()}
+    if 'Routers' in clients:
+        start = time.perf_counter()
+        await build_network(clients['Routers'], args.routers, args.degree, args.seed)
+        print('network of {} routers imported in {:.2f} s'.format(args.routers, time.perf_counter() - start))
+
+    results = []
+    for name in args.workloads:
+        folder, make_requests = WORKLOADS[name]
+        requests = make_requests(random.Random(args.seed), args)
+        await run_workload(clients[folder], requests, args.warmup, args.concurrency) # not counted, fills caches and starts threads
+        latencies, errors, seconds = await run_workload(clients[folder], requests, args.requests, args.concurrency)
+        latencies.sort()
+        results.append({
+            'workload': name,
+            'requests': len(latencies) + errors,
+            'errors': errors,
+            'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+            'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+            'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else None,
+            'requests_per_second': (len(latencies) + errors) / seconds,
+        })
+    for client in clients.values():
+        await client.aclose()
+    return results
+
+# function to print the results as a table, with the change from an earlier run if there is one
+def show(results, baseline=None):
+    before = {result['workload']: result for result in (baseline or {}).get('results', [])}
+    print('{:>10}  {:>8}  {:>6}  {:>10}  {:>10}  {:>10}  {:>10}'.format('workload', 'requests', 'errors', 'p50 ms', 'p99 ms', 'mean ms', 'req/s'))
+    for result in results:
+        print('{:>10}  {:>8}  {:>6}  {:>10.3f}  {:>10.3f}  {:>10.3f}  {:>10.1f}'.format(
+            result['workload'], result['requests'], result['errors'], result['p50_ms'] or 0, result['p99_ms'] or 0, result['mean_ms'] or 0, result['requests_per_second']))
+        old = before.get(result['workload'])
+        if old and old['p50_ms'] and result['p50_ms']:
+            print('{:>10}  {:>8}  {:>6}  {:>+9.1f}%  {:>+9.1f}%  {:>+9.1f}%  {:>+9.1f}%'.format(
+                'change', '', '', change(old['p50_ms'], result['p50_ms']), change(old['p99_ms'], result['p99_ms']),
+                change(old['mean_ms'], result['mean_ms']), change(old['requests_per_second'], result['requests_per_second'])))
+
+def change(old, new): # percent change from old to new
+    return (new - old) / old * 100
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the IP calculator and routers apps in process.')
+    parser.add_argument('--workloads', nargs='+', choices=list(WORKLOADS), default=list(WORKLOADS), help='workloads to run, in order')
+    parser.add_argument('--requests', type=int, default=2000, help='requests timed for each workload')
+    parser.add_argument('--warmup', type=int, default=100, help='requests sent before timing each workload')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight at once')
+    parser.add_argument('--routers', type=int, default=10000, help='number of routers in the random network')
+    parser.add_argument('--degree', type=int, default=4, help='average number of links per router')
+    parser.add_argument('--supernet-size', type=int, default=16, help='addresses in each /supernet request')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier run to compare against')
+    args = parser.parse_args()
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    results = asyncio.run(run(args))
+    show(results, baseline)
+    if args.output:
+        config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+        report = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(), 'config': config, 'results': results}
+        Path(args.output).write_text(json.dumps(report, indent=2) + '\n')
+        print('results saved to', args.output)
+
+if __name__ == '__main__':
+    main()